@@ -94,9 +94,18 @@ class core(commands.Cog):
     enable = discord.SlashCommandGroup("enable-minecraft")
 
     @enable.command(name="updater")
-    async def enable_updater(self, ctx, mode: bool):
+    async def enable_updater(
+        self,
+        ctx,
+        mode: bool,
+        channel: str = Option(
+            description="Follow releases only, or snapshots too",
+            choices=[OptionChoice(name="release"), OptionChoice(name="snapshot")],
+            default="snapshot",
+        ),
+    ):
         if mode == False:
-            func.conf_add(ctx.guild.id, ["Minecraft"], "updater-enabled", False)
+            func.conf_add(ctx.guild.id, ["Minecraft"], "updater_enabled", False)
             await ctx.respond("Updater disabled")
             return
 
@@ -111,8 +120,10 @@ class core(commands.Cog):
             )
             return
 
-        func.conf_add(ctx.guild.id, ["Minecraft"], "updater-enabled", True)
-        await ctx.respond("Updater enabled!")
+        with func.conf_txn(ctx.guild.id) as cDoc:
+            func.conf_set(cDoc, ["Minecraft"], "updater_enabled", True)
+            func.conf_set(cDoc, ["Minecraft"], "update_channel", channel)
+        await ctx.respond(f"Updater enabled! Following the {channel} channel")
 
     @enable.command(name="chat")
     async def enable_chat(self, ctx, mode: bool, chat_channel: discord.TextChannel):
@@ -123,8 +134,8 @@ class core(commands.Cog):
                 )
                 return
         else:
-            func.conf_add(ctx.guild.id, ["Minecraft"], "updater-enabled", False)
-            await ctx.respond("Updater disabled")
+            func.conf_add(ctx.guild.id, ["Minecraft"], "chat_enabled", False)
+            await ctx.respond("Chat disabled")
             return
 
         sftp = func.conf_get(
@@ -149,8 +160,9 @@ class core(commands.Cog):
             )
             return
 
-        func.conf_add(ctx.guild.id, ["Minecraft"], "chat-enabled", True)
-        func.conf_add(ctx.guild.id["Minecraft"], "chat_channel_id", chat_channel.id)
+        with func.conf_txn(ctx.guild.id) as cDoc:
+            func.conf_set(cDoc, ["Minecraft"], "chat_enabled", True)
+            func.conf_set(cDoc, ["Minecraft"], "chat_channel_id", chat_channel.id)
         await ctx.respond("Chat enabled!")
 
     setup = discord.SlashCommandGroup("setup-minecraft")
@@ -176,8 +188,9 @@ class core(commands.Cog):
         )
         await ctx.send_modal(m)
         data = await m.wait_until_done()
-        for key, value in data.items():
-            func.conf_add(ctx.guild.id, ["Minecraft", "panel"], key, value)
+        with func.conf_txn(ctx.guild.id) as cDoc:
+            for key, value in data.items():
+                func.conf_set(cDoc, ["Minecraft", "panel"], key, value)
 
         await ctx.respond("Info Collected :)")
 
@@ -203,8 +216,9 @@ class core(commands.Cog):
         )
         await ctx.send_modal(m)
         data = await m.wait_until_done()
-        for key, value in data.items():
-            func.conf_add(ctx.guild.id, ["Minecraft", "panel"], key, value)
+        with func.conf_txn(ctx.guild.id) as cDoc:
+            for key, value in data.items():
+                func.conf_set(cDoc, ["Minecraft", "panel"], key, value)
         await ctx.respond("Info Collected :)")
 
     @setup.command(name="rcon")
@@ -228,8 +242,9 @@ class core(commands.Cog):
         await ctx.send_modal(m)
         data = await m.wait_until_done()
 
-        for key, value in data.items():
-            func.conf_add(ctx.guild.id, ["Minecraft", "panel"], key, value)
+        with func.conf_txn(ctx.guild.id) as cDoc:
+            for key, value in data.items():
+                func.conf_set(cDoc, ["Minecraft", "rcon"], key, value)
         await ctx.respond("Info Collected :)")
 
     @setup.command(name="server")
@@ -254,8 +269,9 @@ class core(commands.Cog):
         await ctx.send_modal(m)
         data = await m.wait_until_done()
 
-        for key, value in data.items():
-            func.conf_add(ctx.guild.id, ["Minecraft", "panel"], key, value)
+        with func.conf_txn(ctx.guild.id) as cDoc:
+            for key, value in data.items():
+                func.conf_set(cDoc, ["Minecraft", "panel"], key, value)
         await ctx.respond("Info Collected :)")
 
 
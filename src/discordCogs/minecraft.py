@@ -1,60 +1,303 @@
-import discord, os, json, aiohttp, paramiko, requests, hashlib, re
+import asyncio, discord, os, json, struct, time
 from discord.ext import commands, tasks
-from mcrcon import MCRcon
 import utils.functions as util
+import utils.sftp as mcsftp
+import utils.rcon as mcrcon
+import utils.logs as mclogs
+import utils.executor as executor
+import utils.updater as updater
+from utils.config import guild_config, watcher
+from utils.scheduler import GuildScheduler
+from utils.mc import PresenceTracker, TellrawQueue
+from utils.outbound import WebhookCache, Coalescer, Dispatcher, DestinationRegistry
 from utils.exception import *
-from discord import Webhook
 
 
 class MinecraftLogProcessor:
-    def __init__(self, state_file="data/log_state.json"):
+    """
+    Log tail offset and processed-message store, checkpointed together.
+
+    Changes are kept in memory and written behind: checkpoint() only writes
+    when something changed and `flush_interval` seconds have passed, flush()
+    writes immediately (used on shutdown). Both are written as one record with
+    an atomic rename, so the offset and the dedup store on disk always agree.
+    With a StateStore the record is the guild's log_state row instead, and
+    the store batches the writes of all guilds.
+    """
+
+    HEADER = struct.Struct("<4sQ")
+    MAGIC = b"MLP1"
+
+    def __init__(
+        self,
+        state_file="data/log_state.bin",
+        capacity=4096,
+        window=None,
+        flush_interval=5,
+        store=None,
+        guild_id=None,
+    ):
         self.state_file = state_file
-        self.processed_messages = set()
+        self.flush_interval = flush_interval
+        self.store = store
+        self.guild_id = guild_id
+        self.processed_messages = mclogs.DedupStore(capacity, window)
+        self.offset = 0
+        self.dirty = False
+        self.last_flush = time.monotonic()
         self.load_state()
 
     def load_state(self):
-        """Load the processing state from file"""
+        """Load the processing state from the store or file"""
+        if self.store is not None:
+            state = self.store.get_log_state(self.guild_id)
+            if state is not None:
+                try:
+                    self.processed_messages.loads(state[1])
+                    self.offset = state[0]
+                except:
+                    self.processed_messages.clear()
+                    self.offset = 0
+                return
+            self.dirty = True  # whatever the files hold goes into the store
+
         if os.path.exists(self.state_file):
             try:
-                with open(self.state_file, "r") as f:
-                    data = json.load(f)
-                    self.processed_messages = set(data.get("processed_messages", []))
+                with open(self.state_file, "rb") as f:
+                    data = f.read()
+                magic, offset = self.HEADER.unpack_from(data)
+                if magic != self.MAGIC:
+                    raise ValueError("not a log state record")
+                self.processed_messages.loads(data[self.HEADER.size :])
+                self.offset = offset
             except:
-                self.processed_messages = set()
+                self.processed_messages.clear()
+                self.offset = 0
+            return
+
+        # global files written before state was per guild and combined, the
+        # first guild to load takes them over
+        try:
+            if os.path.exists("data/lastPosition.txt"):
+                with open("data/lastPosition.txt", "r") as f:
+                    self.offset = int(f.read().strip())
+                os.replace("data/lastPosition.txt", "data/lastPosition.txt.migrated")
+                self.dirty = True
+            if os.path.exists("data/log_state.json"):
+                # md5 hex digests, keep the first 64 bits
+                with open("data/log_state.json", "r") as f:
+                    data = json.load(f)
+                for message_hash in data.get("processed_messages", []):
+                    self.processed_messages.add(int(message_hash[:16], 16))
+                os.replace("data/log_state.json", "data/log_state.json.migrated")
+                self.dirty = True
+        except:
+            self.processed_messages.clear()
+            self.offset = 0
 
     def save_state(self):
-        """Save the current processing state to file"""
-        with open(self.state_file, "w") as f:
-            json.dump({"processed_messages": list(self.processed_messages)}, f)
+        """Save the current processing state to the store or file"""
+        if self.store is not None:
+            self.store.put_log_state(
+                self.guild_id, self.offset, self.processed_messages.dumps()
+            )
+        else:
+            util.atomic_write(
+                self.state_file,
+                self.HEADER.pack(self.MAGIC, self.offset)
+                + self.processed_messages.dumps(),
+            )
+        self.dirty = False
+        self.last_flush = time.monotonic()
+
+    def checkpoint(self):
+        """Save the state if it changed and the flush interval has passed"""
+        if self.dirty and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.save_state()
+
+    def flush(self):
+        """Save the state now if it changed"""
+        if self.dirty:
+            self.save_state()
 
     def add_message(self, message_hash):
-        """Add a message hash to the processed set"""
+        """Add a message digest to the processed store"""
         self.processed_messages.add(message_hash)
-        self.save_state()
+        self.dirty = True
 
     def has_message(self, message_hash):
-        """Check if a message hash has been processed"""
+        """Check if a message digest has been processed"""
         return message_hash in self.processed_messages
 
+    def configure(self, capacity, window):
+        """Resize the processed store, keeping the newest entries that fit"""
+        if (capacity, window) == (
+            self.processed_messages.capacity,
+            self.processed_messages.window,
+        ):
+            return
+        processed_messages = mclogs.DedupStore(capacity, window)
+        processed_messages.loads(self.processed_messages.dumps())
+        self.processed_messages = processed_messages
+        self.dirty = True
+
+    def set_offset(self, offset):
+        """Record how far into the log has been processed"""
+        if offset != self.offset:
+            self.offset = offset
+            self.dirty = True
+
+    def clear(self):
+        """Forget every processed message, used when the log rotates"""
+        self.processed_messages.clear()
+        self.offset = 0
+        self.dirty = True
+
 
 class minecraft(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.message_tracker = MinecraftLogProcessor()
+        self.message_trackers = {}  # guild_id: MinecraftLogProcessor
+        self.presence = {}  # guild_id: PresenceTracker
+        self.webhooks = WebhookCache()
+        self.destinations = DestinationRegistry(bot)
+        self.dispatcher = Dispatcher(self.sendToDiscord)
+        self.coalescer = Coalescer(self.dispatcher.put)
+        self.tellraw = TellrawQueue(self.runTellraw)
+        self.sftp_pool = mcsftp.SFTPPool()
+        self.rcon_pool = mcrcon.RconPool()
+        bot_conf = util.bot_conf_view(["Minecraft"])
+        self.manifests = updater.ManifestCache()
+        self.jars = updater.JarCache(
+            max_bytes=int(bot_conf.get("jar_cache_mb", 1024)) * 1024 * 1024
+        )
+        self.updates = updater.UpdatePipeline(
+            self.updateGuild, concurrency=bot_conf.get("update_concurrency", 4)
+        )
+        self.fetch_scheduler = GuildScheduler(
+            self.fetchGuildLogs,
+            concurrency=bot_conf.get("fetch_concurrency", 8),
+            deadline=bot_conf.get("fetch_deadline", 10),
+            name="log fetch",
+            bounds=self.pollBounds,
+        )
+        watcher.subscribe(self.onRconChange, fields=["rcon"])
+        watcher.subscribe(self.onSftpChange, fields=["sftp"])
+        watcher.subscribe(self.onDiscordChange, fields=["discord"])
+        watcher.subscribe(
+            self.onDedupChange, fields=["dedup_capacity", "dedup_window"]
+        )
+        watcher.subscribe(
+            self.onPollChange, fields=["chat_enabled", "poll_min", "poll_max"]
+        )
+        watcher.subscribe_bot(self.onBotConfigChange, keys=["Minecraft"])
         self.checkServerUpdates.start()
+        self.fetchLogsLoop.start()
+        self.watchConfigLoop.start()
+
+    def cog_unload(self):
+        self.checkServerUpdates.cancel()
+        self.fetchLogsLoop.cancel()
+        self.watchConfigLoop.cancel()
+        for callback in (
+            self.onRconChange,
+            self.onSftpChange,
+            self.onDiscordChange,
+            self.onDedupChange,
+            self.onPollChange,
+            self.onBotConfigChange,
+        ):
+            watcher.unsubscribe(callback)
+        # state is saved here and not in _close: on shutdown the bot cancels
+        # that task before it gets past its first awaits. Cancelled fetch jobs
+        # can't advance an offset after this flush, they stop at their next await.
+        # The offsets already cover lines still waiting in the coalescer and
+        # dispatcher, _close only tries to deliver those, what it can't send
+        # (or everything, if it is cancelled) is lost rather than sent twice
+        self.fetch_scheduler.cancel()
+        self.sftp_pool.close()
+        for message_tracker in self.message_trackers.values():
+            message_tracker.flush()
+        util.close_state_store()  # commits the buffered log_state rows
+        self.bot.loop.create_task(self._close())
+
+    async def _close(self):
+        await self.updates.close()
+        await self.fetch_scheduler.close()
+        await self.tellraw.close()
+        await self.rcon_pool.close()
+        await self.coalescer.close()
+        await self.dispatcher.close()
+        await self.webhooks.close()
+
+    # config changes, see utils.config.ConfigWatcher
+    def onRconChange(self, guild_id, old, new):
+        self.presence.pop(guild_id, None)
+        return self.rcon_pool.drop(guild_id)
+
+    def onSftpChange(self, guild_id, old, new):
+        self.sftp_pool.drop(guild_id)
+
+    def onDiscordChange(self, guild_id, old, new):
+        self.destinations.invalidate(guild_id)
+
+    def onDedupChange(self, guild_id, old, new):
+        message_tracker = self.message_trackers.get(guild_id)
+        if message_tracker is not None:
+            message_tracker.configure(new.dedup_capacity, new.dedup_window)
+
+    def onPollChange(self, guild_id, old, new):
+        self.fetch_scheduler.wake(guild_id)  # picks up the new bounds
+
+    def onBotConfigChange(self, old, new):
+        self.fetch_scheduler.configure(
+            concurrency=new.get("fetch_concurrency", 8),
+            deadline=new.get("fetch_deadline", 10),
+        )
+
+    def get_message_tracker(self, guild_id):
+        """Return the guild's log processing state, loading it on first use"""
+        if guild_id not in self.message_trackers:
+            conf = guild_config(guild_id)
+            self.message_trackers[guild_id] = MinecraftLogProcessor(
+                state_file=f"data/log_state/{guild_id}.bin",
+                capacity=conf.dedup_capacity,
+                window=conf.dedup_window,
+                store=util.state_store(),
+                guild_id=guild_id,
+            )
+        return self.message_trackers[guild_id]
+
+    def get_presence(self, guild_id):
+        """Return the guild's online player tracker"""
+        if guild_id not in self.presence:
+            self.presence[guild_id] = PresenceTracker()
+        return self.presence[guild_id]
 
     @discord.slash_command()
     async def list(self, ctx):
-        try:
-            rcon = util.conf_get(["Minecraft", "rcon"])
-        except Exception as e:
+        conf = guild_config(ctx.guild.id)
+        rcon = conf.rcon
+        if rcon is None:
             await ctx.respond("Rcon details missing")
             return
-        with MCRcon(rcon["host"], rcon["password"], rcon["port"]) as mcr:
-            list = mcr.command("list")
+        presence = self.get_presence(ctx.guild.id)
+        # join/leave lines only keep the tracker current while the log is tailed
+        tailed = conf.chat_enabled and conf.sftp is not None
+        if presence.stale or not tailed:
+            try:
+                output = await self.rcon_pool.command(ctx.guild.id, rcon, "list")
+            except Exception as e:
+                await ctx.respond(f"Failed to reach the server: {e}")
+                return
+            try:
+                presence.reconcile(output)
+            except RconError:
+                await ctx.respond(output)  # a format the tracker doesn't know, show it as is
+                return
 
-        await ctx.respond(list)
+        await ctx.respond(presence.format())
 
     admin = discord.SlashCommandGroup("mc-admin")
 
@@ -63,10 +306,16 @@ class minecraft(commands.Cog):
         description="Resyncs the channel. (currently only deletes and recreates the channel)",
     )  # add command management
     async def resync(self, ctx):
-        # delete and recreate channel and fetch all logs
-        self.fetchLogsLoop.stop()
-        discord = util.get_conf(["Discord"])
-        oldChannel = self.bot.get_channel(discord["channel_id"])
+        # delete and recreate channel, polling carries on, the destination
+        # is re-resolved once the new channel id is saved
+        discord_conf = guild_config(ctx.guild.id).discord
+        if discord_conf is None or discord_conf.channel_id is None:
+            await ctx.respond("No chat channel configured to resync")
+            return
+        oldChannel = self.bot.get_channel(discord_conf.channel_id)
+        if oldChannel is None:
+            await ctx.respond(f"Channel {discord_conf.channel_id} not found")
+            return
 
         newChannel = await ctx.guild.create_text_channel(
             name=oldChannel.name,
@@ -79,204 +328,251 @@ class minecraft(commands.Cog):
             reason="resync",
         )
         await oldChannel.delete(reason="resync")
-        util.conf_add(["Discord"], "channel_id", newChannel.id)
+        util.conf_add(ctx.guild.id, ["Discord"], "channel_id", newChannel.id)
+        self.destinations.invalidate(ctx.guild.id)
 
-        self.fetchLogsLoop.start()
         await ctx.respond("resynced")
 
+    @admin.command(
+        name="poll-status",
+        description="Shows how often the server log is currently polled.",
+    )
+    async def poll_status(self, ctx):
+        interval = self.fetch_scheduler.interval(ctx.guild.id)
+        if interval is None:
+            await ctx.respond("The log has not been polled yet")
+            return
+        minimum, maximum = self.pollBounds(ctx.guild)
+        await ctx.respond(
+            f"Polling every {interval:g}s (min {minimum:g}s, max {maximum:g}s)"
+        )
+
     @discord.slash_command()
     @commands.is_owner()  # TODO: check if admin perm OR has staff role
     async def update(self, ctx):
-        self.checkServerUpdates
-        await ctx.respond("Checking for updates...")
+        progress = self.updates.progress.get(ctx.guild.id)
+        if progress is None or progress.done:
+            conf = guild_config(ctx.guild.id)
+            if not conf.updater_enabled or conf.panel is None:
+                await ctx.respond("The updater is not enabled")
+                return
+            progress = self.updates.start(ctx.guild)
+        await ctx.respond(progress.format())
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.destinations.invalidate_channel(channel.id)
 
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author == self.bot.user:
             return
-        mc_conf = util.conf_get(message.guild.id, ["Minecraft"])
-        if mc_conf["chat_enabled"] == False or None:
+        if message.guild is None:
             return
-        if message.channel.id != mc_conf["chat_channel_id"]:
+        conf = guild_config(message.guild.id)
+        if not conf.chat_enabled or message.channel.id != conf.chat_channel_id:
             return
+        self.fetch_scheduler.wake(message.guild.id)  # replies are likely
 
-        rcon = util.conf_get(message.guild.id, ["Minecraft", "rcon"])
-        if rcon is None:
+        if conf.rcon is None:
             return
+        presence = self.presence.get(message.guild.id)
+        if presence is not None and not presence.stale and not presence.online:
+            return  # nobody online to read it
 
-        with MCRcon(rcon["host"], rcon["password"], rcon["port"]) as mcr:
-            mcr.command(
-                f'tellraw @a {{text:"[DISCORD] <{message.author.name}> {message.content}"}}'
-            )
+        self.tellraw.add(message.guild.id, message.author.name, message.content)
+
+    async def runTellraw(self, guild_id, command):
+        """Run a batched tellraw command, called by the tellraw queue"""
+        rcon = guild_config(guild_id).rcon
+        if rcon is not None:
+            await self.rcon_pool.command(guild_id, rcon, command)
 
     @tasks.loop(hours=1)
     async def checkServerUpdates(self):
+        guilds = []
         for guild in self.bot.guilds:
+            conf = guild_config(guild.id)
+            if conf.updater_enabled and conf.panel is not None:
+                guilds.append(guild)
+        await self.updates.run(guilds)
+
+    async def updateGuild(self, guild, progress):
+        """Update one guild's server jar, run by the update pipeline"""
+        conf = guild_config(guild.id)
+        panel = updater.PanelClient(conf.panel)
+
+        progress.enter("check")
+        if not await panel.is_minecraft():
+            return False
+        latestVersion = await self.manifests.latest(conf.update_channel)
+        if latestVersion == conf.current_version:
+            return False
+        progress.version = latestVersion
+        server = (await self.manifests.version(latestVersion))["downloads"]["server"]
+
+        progress.enter("download")
+        # shared by every guild on this version, pinned until uploaded
+        async with self.jars.open(
+            server["url"], server["sha1"], server.get("size")
+        ) as jar_path:
+            progress.enter("stop")
+            await panel.power("stop")
             try:
-                is_enabled = util.conf_get(
-                    guild.id, keys=["Minecraft", "updater_enabled"]
+                await panel.wait_for_state("offline")
+
+                progress.enter("upload")
+                await updater.upload_file(
+                    lambda: panel.upload_url("/"),
+                    jar_path,
+                    "server.jar",  # cached under its digest
+                    fields={"directory": "/"},
+                    progress=progress.transferred,
                 )
-            except:
-                continue
-            if is_enabled == False or None:
-                continue
-
-            api = util.conf_get(guild.id, keys=["Minecraft", "panel"])
-            headers = {
-                "Authorization": f"Bearer {api['api_key']}",
-                "Content-Type": "application/json",
-                "Accept": "Application/vnd.pterodactyl.v1+json",
-            }
-            url = api["url"]
-            response = requests.get(url, headers=headers)
-            is_minecraft = response.json()["attributes"]["is_minecraft"]
-            if not is_minecraft:
-                continue
-            mc_conf = util.conf_get(guild.id, keys=["Minecraft"])
-            try:
-                currentVersion = mc_conf["currentVersion"]
-            except:
-                currentVersion = None
-            versionsURL = (
-                "https://launchermeta.mojang.com/mc/game/version_manifest.json"
-            )
-            versionsManifest = requests.get(versionsURL).json()
-            latestVersion = versionsManifest["versions"][0]["id"]
-            if latestVersion == currentVersion:
-                return
-            latestURL = versionsManifest["versions"][0]["url"]
-            snapshotManifest = requests.get(latestURL).json()
-            serverDownloadURL = snapshotManifest["downloads"]["server"]["url"]
-            server = requests.get(serverDownloadURL).content
-            with open("server.jar", "wb") as f:
-                f.write(server)
-            power_url = f"{api['url']}/api/client/servers/{api['server_id']}/power"
-            requests.post(power_url, headers=headers, json='{"signal": "stop"}')
-
-            upload_url = (
-                f"{api['url']}/api/client/servers/{api['server_id']}/files/upload"
-            )
-            response = requests.get(
-                upload_url, headers=headers, params={"directory": "/"}
-            )
-            signed_url = response.json()["attributes"]["url"]
-
-            with open("/server.jar", "rb") as f:
-                files = {"files": f}
-                data = {"directory": "/"}
-                requests.post(signed_url, files=files, data=data)
+            except Exception:
+                try:
+                    await panel.power("start")  # don't leave the server down
+                except Exception as e:
+                    print(f"Failed to restart the server of guild {guild.id}: {e}")
+                raise
+
+        progress.enter("start")
+        await panel.power("start")
+
+        progress.enter("verify")
+        await panel.wait_for_state("running", timeout=300)
+        util.conf_add(
+            guild.id,
+            keys=["Minecraft"],
+            name="current_version",
+            value=latestVersion,
+        )
+        return True
 
-            requests.post(power_url, headers=headers, json='{"signal": "start"}')
-
-            currentVersion = snapshotManifest["id"]
-            util.conf_add(
-                guild.id,
-                keys=["Minecraft"],
-                name="currentVersion",
-                value=currentVersion,
-            )
-            os.remove("server.jar")
+    def _tail_log(self, guild_id, sftp, last_pos):
+        """Blocking SFTP part of a fetch, run on the executor"""
+        client = self.sftp_pool.get(guild_id, sftp)
+        return mcsftp.tail(client, "logs/latest.log", last_pos)
 
     # REQUIRES RCON, SFTP
-    @tasks.loop(seconds=1)
+    @tasks.loop(seconds=0.5)  # granularity only, each guild polls on its own interval
     async def fetchLogsLoop(self):
-        for guild in self.bot.guilds:
-            try:
-                is_enabled = util.conf_get(guild.id, keys=["Minecraft", "chat_enabled"])
-            except:
-                continue
-            if not is_enabled:
-                continue
-            rcon = util.conf_get(["Minecraft", "rcon"])
-            if rcon is None:
-                return
-
-            # check for players online
-            with MCRcon(rcon["host"], rcon["password"], rcon["port"]) as mcr:
-                listOutput = mcr.command("list")
-                playerCount = re.search(r"\d+", listOutput).group(0)
-            if playerCount == "0":
-                return  # no players online so no need to look for messages
-
-            sftp = util.conf_get(["Minecraft", "sftp"])
-            if sftp is None:
-                return
+        self.fetch_scheduler.tick(self.bot.guilds)
+        store = util.state_store()
+        if store is not None:
+            store.flush_due()  # bounds the write-behind window when logs go quiet
+
+    @tasks.loop(seconds=watcher.interval)
+    async def watchConfigLoop(self):
+        await watcher.poll()
+
+    async def sendToDiscord(self, destination, username, content):
+        """Send one coalesced message, called by the dispatcher's workers"""
+        kind, target = destination
+        if kind == "webhook":
+            return await self.webhooks.execute(
+                target,
+                content,
+                username=username,
+                avatar_url=f"https://minotar.net/avatar/{username}/100.png",
+            )
+        channel = self.destinations.channel(target)
+        if channel is None:
+            raise ValueError(f"channel {target} not found")
+        try:
+            await channel.send(content)
+        except discord.HTTPException as e:
+            if e.status == 429:
+                raise RateLimited(float(e.response.headers.get("Retry-After", 1)))
+            raise
+
+    def pollBounds(self, guild):
+        """The guild's (min, max) log poll interval in seconds"""
+        conf = guild_config(guild.id)
+        return conf.poll_min, conf.poll_max
+
+    async def fetchGuildLogs(self, guild):
+        """Forward new log events for one guild, returns whether the log grew"""
+        conf = guild_config(guild.id)
+        if not conf.chat_enabled or conf.rcon is None or conf.sftp is None:
+            return
+        rcon, sftp = conf.rcon, conf.sftp
 
-            # fetch latest log
+        # players online come from join/leave lines, RCON only when stale
+        presence = self.get_presence(guild.id)
+        if presence.due:
             try:
-                with paramiko.SSHClient() as ssh:
-                    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                    ssh.connect(
-                        sftp["host"],
-                        username=sftp["username"],
-                        password=sftp["password"],
-                        port=sftp["port"],
+                presence.reconcile(
+                    await asyncio.wait_for(
+                        self.rcon_pool.command(guild.id, rcon, "list"), 5
                     )
-                    with ssh.open_sftp() as sftp:
-                        sftp.get("logs/latest.log", "data/latest.log")
+                )
             except Exception as e:
-                print(f"Failed to fetch logs: {e}")
-                return
-
-            if os.path.exists("data/lastPosition.txt"):
-                with open("data/lastPosition.txt", "r") as f:
-                    last_pos = int(f.read().strip())
-            else:
-                last_pos = 0
-            current_size = os.path.getsize("data/latest.log")
-            if current_size < last_pos:
-                last_pos = 0
+                # keep forwarding chat, presence stays log-derived until RCON is back
+                presence.failed()
+                print(f"Failed to reconcile players for guild {guild.id}: {e}")
 
-                self.message_tracker.processed_messages = set()
-                self.message_tracker.save_state()
+        destination = self.destinations.get(guild.id)
+        if destination is not None and self.dispatcher.full(destination.key):
+            return True  # leave new lines in the log until Discord catches up
 
-            new_messages = []
+        message_tracker = self.get_message_tracker(guild.id)
+        last_pos = message_tracker.offset
 
-            with open("data/latest.log", "r", encoding="utf-8", errors="ignore") as f:
-                f.seek(last_pos)
-
-                pattern = r"^\[(\d{2}:\d{2}:\d{2})\] \[.*?\]: <(\w+)> (.*)$"
-
-                for line in f:
-                    match = re.match(pattern, line)
-                    if match:
-                        timestamp, username, message = match.groups()
-
-                        message_hash = hashlib.md5(
-                            f"{timestamp}:{username}:{message}".encode()
-                        ).hexdigest()
+        # tail latest log, only the bytes appended since last_pos are fetched
+        try:
+            data, new_pos, rotated = await executor.run_blocking(
+                self._tail_log, guild.id, sftp, last_pos
+            )
+        except Exception as e:
+            self.sftp_pool.drop(guild.id)  # reconnect on the next tick
+            print(f"Failed to fetch logs: {e}")
+            return
 
-                        if not self.message_tracker.has_message(message_hash):
-                            new_messages.append(
-                                (timestamp, username, message, message_hash)
-                            )
-                            self.message_tracker.add_message(message_hash)
+        if rotated:
+            message_tracker.clear()
+            presence.invalidate()  # server restarted
 
-                # Save the new position
-                with open("data/lastPosition.txt", "w") as pos_file:
-                    pos_file.write(str(f.tell()))
+        new_messages = []
 
-            discord = util.conf_get(["Discord"])
-            if discord is None:
-                return
+        for event in mclogs.parse(data):
+            message_hash = mclogs.DedupStore.digest(
+                f"{event.timestamp}:{event.player}:{event.message}"
+            )
 
-            for timestamp, username, message, message_hash in new_messages:
-                try:
-                    if discord["use_webhook"] == True:
-                        async with aiohttp.ClientSession() as session:
-                            webhook = Webhook.from_url(
-                                discord["webhook_url"], session=session
-                            )
-                            await webhook.send(
-                                content=message,
-                                username=username,
-                                avatar_url=f"https://minotar.net/avatar/{username}/100.png",
-                            )
-                    else:
-                        channel = self.bot.get_channel(discord["channel_id"])
-                        await channel.send(f"{username}: {message}")
-                except Exception as e:
-                    print(f"Error sending message: {e}")
+            if not message_tracker.has_message(message_hash):
+                new_messages.append(event)
+                message_tracker.add_message(message_hash)
+
+        presence.apply(new_messages)
+
+        # Save the new position, written to disk with the processed messages.
+        # This is before delivery: lines still queued for Discord when the cog
+        # unloads are dropped, not re-read and forwarded on the next start
+        message_tracker.set_offset(new_pos)
+        message_tracker.checkpoint()
+
+        if destination is None:
+            return bool(data)
+
+        for event in new_messages:
+            if event.kind == "chat":
+                message = event.message
+            elif event.kind == "me":
+                message = f"*{event.player} {event.message}*"
+            elif event.kind == "say":
+                message = f"[{event.player}] {event.message}"
+            else:  # join, leave, advancement, death
+                message = f"*{event.message}*"
+            if destination.use_webhook:  # grouped by speaker, the username is per message
+                username = event.player
+            else:  # one multi-line block
+                username = None
+                if event.kind == "chat":
+                    message = f"{event.player}: {message}"
+            self.coalescer.add(destination.key, username, message, destination.hold)
+
+        return bool(data)  # new log lines keep the guild on its fast interval
 
 
 def setup(bot):
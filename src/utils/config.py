@@ -0,0 +1,356 @@
+import asyncio, inspect, time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+import utils.functions as util
+import utils.executor as executor
+
+# key spellings written by older versions and the setup modals -> canonical
+ALIASES = {
+    "base_url": "url",
+    "rcon_port": "port",
+    "rcon_password": "password",
+    "currentversion": "current_version",
+}
+
+# default log poll bounds in seconds
+POLL_MIN = 1.0
+POLL_MAX = 30.0
+
+
+@dataclass(frozen=True, slots=True)
+class RconConfig:
+    host: str
+    port: int
+    password: str
+
+
+@dataclass(frozen=True, slots=True)
+class SftpConfig:
+    host: str
+    port: int
+    username: str
+    password: str
+
+
+@dataclass(frozen=True, slots=True)
+class PanelConfig:
+    url: str
+    api_key: str
+    server_id: str
+
+
+@dataclass(frozen=True, slots=True)
+class DiscordConfig:
+    use_webhook: bool
+    webhook_url: Optional[str]
+    channel_id: Optional[int]
+    coalesce_hold: Optional[float]
+
+
+@dataclass(frozen=True, slots=True)
+class GuildConfig:
+    """
+    Validated snapshot of one guild's configuration.
+
+    Built once per version of the guild's TOML file, hot paths read plain
+    attributes from it. A section that is missing or invalid is None, the
+    reasons are kept in `errors`.
+    """
+
+    guild_id: int
+    chat_enabled: bool = False
+    chat_channel_id: Optional[int] = None
+    updater_enabled: bool = False
+    current_version: Optional[str] = None
+    update_channel: str = "snapshot"  # "release" or "snapshot"
+    poll_min: float = POLL_MIN
+    poll_max: float = POLL_MAX
+    dedup_capacity: int = 4096  # processed log messages remembered
+    dedup_window: Optional[float] = None  # seconds they are remembered, None for no limit
+    rcon: Optional[RconConfig] = None
+    sftp: Optional[SftpConfig] = None
+    panel: Optional[PanelConfig] = None
+    discord: Optional[DiscordConfig] = None
+    errors: Tuple[str, ...] = ()
+
+
+_snapshots = {}  # guild_id: (config version, GuildConfig)
+
+
+def guild_config(guild_id: int) -> GuildConfig:
+    """
+    Return the validated configuration snapshot of a guild.
+
+    While the config watcher is polling, this is a dict lookup: the watcher
+    and in-process writes replace snapshots as files change. Otherwise the
+    snapshot is revalidated with one os.stat per call and rebuilt only when
+    util.conf_version reports that the guild's file changed.
+
+    Example:
+        >>> conf = guild_config(12345)
+        >>> if conf.chat_enabled and conf.rcon is not None:
+        ...     await rcon_pool.command(12345, conf.rcon, "list")
+    """
+    cached = _snapshots.get(guild_id)
+    if cached is not None and watcher.active:
+        return cached[1]
+    version = util.conf_version(guild_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    return _rebuild(guild_id, version)
+
+
+def _rebuild(guild_id: int, version) -> GuildConfig:
+    snapshot = build_guild_config(guild_id, util.conf_view(guild_id))
+    if snapshot.errors:
+        print(f"Invalid config for guild {guild_id}: {'; '.join(snapshot.errors)}")
+    old = _snapshots.get(guild_id)
+    _snapshots[guild_id] = (version, snapshot)
+    if old is not None:
+        watcher.notify(guild_id, old[1], snapshot)
+    return snapshot
+
+
+def build_guild_config(guild_id: int, raw: Mapping) -> GuildConfig:
+    """Validate and coerce a raw guild config (as from util.conf_view)"""
+    errors = []
+    minecraft = _normalize(raw.get("Minecraft", {}))
+    discord = _normalize(raw.get("Discord", {}))
+
+    def section(name, cls, source, fields, defaults=None):
+        values = dict(defaults or {})
+        values.update(_normalize(source.get(name, {})))
+        if not values or values == (defaults or {}):
+            return None
+        try:
+            return cls(*(coerce(values[field]) for field, coerce in fields))
+        except KeyError as e:
+            errors.append(f"{name}: missing {e.args[0]}")
+        except (TypeError, ValueError) as e:
+            errors.append(f"{name}: {e}")
+        return None
+
+    rcon = section(
+        "rcon",
+        RconConfig,
+        minecraft,
+        [("host", str), ("port", int), ("password", str)],
+        # the rcon setup modal only asks for port and password
+        {"host": minecraft.get("sftp", {}).get("host")} if "sftp" in minecraft else None,
+    )
+    sftp = section(
+        "sftp",
+        SftpConfig,
+        minecraft,
+        [("host", str), ("port", int), ("username", str), ("password", str)],
+    )
+    panel = section(
+        "panel",
+        PanelConfig,
+        minecraft,
+        [("url", str), ("api_key", str), ("server_id", str)],
+    )
+
+    discord_config = None
+    if discord:
+        try:
+            use_webhook = _bool(discord.get("use_webhook", False))
+            discord_config = DiscordConfig(
+                use_webhook,
+                str(discord["webhook_url"]) if use_webhook else None,
+                _optional(int, discord.get("channel_id")),
+                _optional(float, discord.get("coalesce_hold")),
+            )
+            if not use_webhook and discord_config.channel_id is None:
+                errors.append("Discord: set channel_id or use_webhook")
+                discord_config = None
+        except KeyError as e:
+            errors.append(f"Discord: missing {e.args[0]}")
+        except (TypeError, ValueError) as e:
+            errors.append(f"Discord: {e}")
+
+    values = {}
+    for name, coerce in (
+        ("chat_enabled", _bool),
+        ("chat_channel_id", int),
+        ("updater_enabled", _bool),
+        ("current_version", str),
+        ("update_channel", _channel),
+        ("poll_min", float),
+        ("poll_max", float),
+        ("dedup_capacity", _positive_int),
+        ("dedup_window", _window),
+    ):
+        if name in minecraft:
+            try:
+                values[name] = coerce(minecraft[name])
+            except (TypeError, ValueError) as e:
+                errors.append(f"{name}: {e}")
+
+    poll_min = values.get("poll_min", POLL_MIN)
+    poll_max = values.get("poll_max", POLL_MAX)
+    if not 0 < poll_min <= poll_max:
+        # both fall back to the defaults, a zero or negative interval polls every tick
+        errors.append(
+            f"poll bounds: need 0 < poll_min <= poll_max, got {poll_min:g} and {poll_max:g}"
+        )
+        values.pop("poll_min", None)
+        values.pop("poll_max", None)
+
+    return GuildConfig(
+        guild_id,
+        rcon=rcon,
+        sftp=sftp,
+        panel=panel,
+        discord=discord_config,
+        errors=tuple(errors),
+        **values,
+    )
+
+
+def _normalize(table: Any) -> Dict[str, Any]:
+    """Canonical key spelling: lower case, underscores ("chat-enabled", "API Key")"""
+    if not isinstance(table, Mapping):
+        return {}
+    normalized = {}
+    for key, value in table.items():
+        key = str(key).strip().lower().replace("-", "_").replace(" ", "_")
+        normalized[ALIASES.get(key, key)] = value
+    return normalized
+
+
+def _bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "yes", "1", "on"):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ("false", "no", "0", "off", ""):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+def _channel(value: Any) -> str:
+    channel = str(value).strip().lower()
+    if channel not in ("release", "snapshot"):
+        raise ValueError(f"must be release or snapshot, not {value!r}")
+    return channel
+
+
+def _positive_int(value: Any) -> int:
+    number = int(value)
+    if number <= 0:
+        raise ValueError(f"must be positive, not {value!r}")
+    return number
+
+
+def _window(value: Any) -> Optional[float]:
+    """Seconds, 0 or "" for no window"""
+    seconds = _optional(float, value)
+    if seconds is not None and not seconds >= 0:
+        raise ValueError(f"must be 0 or more seconds, not {value!r}")
+    return seconds or None
+
+
+def _optional(coerce, value):
+    return None if value is None or value == "" else coerce(value)
+
+
+class ConfigWatcher:
+    """
+    Propagates config changes to the code that derived state from them.
+
+    poll() stats config.toml and the file of every guild whose snapshot has
+    been loaded from data/server-configs/, rebuilds the snapshots that
+    changed and calls the subscribers whose fields differ. Writes made
+    through utils.functions are applied straight away. Subscribers are plain
+    callables, a returned coroutine is scheduled on the running loop.
+
+    Example:
+        >>> watcher.subscribe(self.onRconChange, fields=["rcon"])
+        >>> watcher.subscribe_bot(self.onBotConfigChange, keys=["Minecraft"])
+        >>> await watcher.poll()  # from a tasks.loop
+    """
+
+    def __init__(self, interval: float = 2):
+        self.interval = interval
+        self.subscribers = []  # (fields or None, callback(guild_id, old, new))
+        self.bot_subscribers = []  # (keys or None, callback(old, new))
+        self.bot_version = None
+        self.bot_view = None  # loaded on the first check
+        self.last_poll = None
+
+    @property
+    def active(self) -> bool:
+        """Whether poll() has run recently enough for snapshots to be trusted"""
+        return (
+            self.last_poll is not None
+            and time.monotonic() - self.last_poll < self.interval * 3
+        )
+
+    def subscribe(self, callback: Callable, fields: Optional[Iterable[str]] = None):
+        """Call callback(guild_id, old, new) when any of the GuildConfig fields change"""
+        self.subscribers.append((tuple(fields) if fields else None, callback))
+
+    def subscribe_bot(self, callback: Callable, keys: Optional[List[str]] = None):
+        """Call callback(old, new) with the bot config at `keys` when it changes"""
+        self.bot_subscribers.append((keys, callback))
+
+    def unsubscribe(self, callback: Callable):
+        self.subscribers = [s for s in self.subscribers if s[1] != callback]
+        self.bot_subscribers = [s for s in self.bot_subscribers if s[1] != callback]
+
+    async def poll(self):
+        """Check every watched file once and apply the changes"""
+        guild_ids = list(_snapshots)
+        versions = await executor.run_blocking(
+            lambda: [util.conf_version(guild_id) for guild_id in guild_ids]
+        )
+        for guild_id, version in zip(guild_ids, versions):
+            cached = _snapshots.get(guild_id)
+            if cached is not None and cached[0] != version:
+                _rebuild(guild_id, version)
+        self.check_bot()
+        self.last_poll = time.monotonic()
+
+    def check_bot(self):
+        """Reload config.toml if it changed and notify the bot subscribers"""
+        version = util._file_version("config.toml")
+        if version == self.bot_version:
+            return
+        old, new = self.bot_view, util.bot_conf_view()
+        self.bot_version, self.bot_view = version, new
+        if old is None:
+            return
+        for keys, callback in list(self.bot_subscribers):
+            old_value = util._lookup(old, keys, util._empty_view)
+            new_value = util._lookup(new, keys, util._empty_view)
+            if old_value != new_value:
+                self._call(callback, old_value, new_value)
+
+    def notify(self, guild_id: int, old: GuildConfig, new: GuildConfig):
+        for fields, callback in list(self.subscribers):
+            if fields is None:
+                changed = old != new
+            else:
+                changed = any(getattr(old, f) != getattr(new, f) for f in fields)
+            if changed:
+                self._call(callback, guild_id, old, new)
+
+    def _on_write(self, server_id: Optional[int]):
+        if server_id is None:
+            self.check_bot()
+        elif server_id in _snapshots:
+            _rebuild(server_id, util.conf_version(server_id))
+
+    @staticmethod
+    def _call(callback: Callable, *args):
+        try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception as e:
+            print(f"Config subscriber {callback.__name__} failed: {e}")
+
+
+watcher = ConfigWatcher()
+util.on_conf_write(watcher._on_write)
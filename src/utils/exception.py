@@ -2,3 +2,28 @@ class SetupError(Exception):
     def __init__(self, message="A custom error occurred."):
         self.message = message
         super().__init__(self.message)
+
+
+class RconError(Exception):
+    def __init__(self, message="RCON request failed."):
+        self.message = message
+        super().__init__(self.message)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float, message="Rate limited by Discord."):
+        self.retry_after = retry_after
+        self.message = message
+        super().__init__(self.message)
+
+
+class DownloadError(Exception):
+    def __init__(self, message="Download failed verification."):
+        self.message = message
+        super().__init__(self.message)
+
+
+class UploadError(Exception):
+    def __init__(self, message="Upload failed."):
+        self.message = message
+        super().__init__(self.message)
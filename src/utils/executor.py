@@ -0,0 +1,72 @@
+import asyncio, functools, requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# shared by every cog, so a burst of slow calls can't start unbounded threads
+MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 30
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared blocking I/O thread pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=MAX_WORKERS, thread_name_prefix="blocking-io"
+        )
+    return _executor
+
+
+async def run_blocking(
+    func: Callable, *args, timeout: float = DEFAULT_TIMEOUT, **kwargs
+) -> Any:
+    """
+    Run a blocking call (requests, paramiko, file I/O) on the shared thread pool.
+
+    The event loop keeps serving the Discord gateway and other guilds while the
+    call runs. The pool is bounded, so when every worker is busy further calls
+    queue instead of spawning threads. If the call does not finish within
+    `timeout` seconds asyncio.TimeoutError is raised to the caller; the worker
+    thread itself cannot be interrupted, so blocking clients should also be
+    given their own socket timeout.
+
+    Args:
+        func (Callable): The blocking function to call.
+        *args: Positional arguments for `func`.
+        timeout (float, optional): Seconds to wait for the result. None waits
+            forever. Defaults to DEFAULT_TIMEOUT.
+        **kwargs: Keyword arguments for `func`.
+
+    Returns:
+        Any: Whatever `func` returns.
+
+    Raises:
+        asyncio.TimeoutError: If the call takes longer than `timeout`.
+
+    Example:
+        >>> client = await run_blocking(pool.get, guild.id, sftp_conf, timeout=15)
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
+    return await asyncio.wait_for(future, timeout)
+
+
+async def request(
+    method: str, url: str, timeout: float = DEFAULT_TIMEOUT, **kwargs
+) -> requests.Response:
+    """
+    Make a `requests` call on the shared thread pool.
+
+    `timeout` is applied both as the requests socket timeout and as the overall
+    wait, so a stalled server frees its worker thread as well as the caller.
+
+    Example:
+        >>> response = await request("GET", url, headers=headers, timeout=10)
+        >>> response.json()
+    """
+    call = functools.partial(requests.request, method, url, timeout=timeout, **kwargs)
+    return await run_blocking(call, timeout=timeout)
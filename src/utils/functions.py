@@ -1,7 +1,10 @@
-import discord, asyncio, os
+import discord, asyncio, os, threading
 import tomlkit as tk
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Union, Tuple, Dict, Any, Callable
+from types import MappingProxyType
+from typing import List, Union, Tuple, Dict, Any, Callable, Iterator, Mapping
+from utils.store import StateStore
 
 # ==================== MODAL CLASSES ====================
 
@@ -474,6 +477,181 @@ def simple_modal(
 # ==================== ADDITIONAL UTILITY FUNCTIONS ====================
 
 
+def atomic_write(path: str, data: Union[str, bytes]):
+    """
+    Replace the contents of a file atomically.
+
+    The data is written and fsync'ed to a temporary file in the same directory
+    which is then renamed over `path`, so readers (and a restart after a crash)
+    see either the old contents or the new ones, never a truncated file.
+
+    Args:
+        path (str): Destination file path.
+        data (Union[str, bytes]): Contents to write, str is written as UTF-8.
+
+    Example:
+        >>> atomic_write("data/log_state.bin", store.dumps())
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_conf_cache = {}  # path: (version, tomlkit document, read-only view)
+_empty_view = MappingProxyType({})
+
+
+_conf_listeners = []  # callables run with the server id (None for config.toml) after a write
+
+_conf_locks = {}  # path: threading.RLock
+_conf_locks_lock = threading.Lock()
+
+
+def _conf_lock(path: str) -> threading.RLock:
+    with _conf_locks_lock:
+        return _conf_locks.setdefault(path, threading.RLock())
+
+
+def on_conf_write(callback: Callable[[Union[int, None]], Any]):
+    """
+    Register a callback run after every config write made through this module.
+
+    The callback gets the server id, or None for the main bot config, and runs
+    in the writing thread once the new file is in place. Used by
+    utils.config to apply in-process edits without waiting for its watcher.
+    """
+    _conf_listeners.append(callback)
+
+
+def _notify_write(server_id: Union[int, None]):
+    for callback in _conf_listeners:
+        try:
+            callback(server_id)
+        except Exception as e:
+            print(f"Config write listener failed: {e}")
+
+
+def _server_conf_path(server_id: int) -> str:
+    return f"data/server-configs/{str(server_id)}.toml"
+
+
+_state_store = None  # StateStore, False when guild config is kept in TOML files
+_state_store_lock = threading.Lock()
+
+
+def state_store() -> Union[StateStore, None]:
+    """
+    The SQLite state store, or None when guild data is kept in files.
+
+    Selected in config.toml with:
+        [Storage]
+        backend = "sqlite"
+        path = "data/state.db"  # optional
+
+    Opened on first use, the existing per-guild config and log state files
+    are imported into it the first time.
+    """
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            storage = bot_conf_view(["Storage"])
+            if storage.get("backend") == "sqlite":
+                _state_store = StateStore(storage.get("path", "data/state.db"))
+                imported = _state_store.import_files()
+                if any(imported.values()):
+                    print(
+                        f"Imported {imported['configs']} server configs and "
+                        f"{imported['log_states']} log states into {_state_store.path}"
+                    )
+            else:
+                _state_store = False
+    return _state_store or None
+
+
+def close_state_store():
+    """
+    Commit buffered writes and close the state store, if it is open.
+
+    The next state_store() call opens it again, so this is safe to call when
+    one cog unloads while others keep reading config.
+    """
+    global _state_store
+    with _state_store_lock:
+        if _state_store:
+            _state_store.close()
+        _state_store = None
+
+
+def _load_server_conf(server_id: int) -> Tuple[tk.TOMLDocument, Mapping]:
+    """_load_conf for a server's config, from the state store when it is enabled"""
+    store = state_store()
+    if store is None:
+        return _load_conf(_server_conf_path(server_id))
+    key = ("store", server_id)
+    cached = _conf_cache.get(key)
+    if cached is not None and cached[0] == store.config_version(server_id):
+        return cached[1], cached[2]
+    row = store.get_config(server_id)
+    version, cDoc = (row[0], tk.parse(row[1])) if row else (None, tk.document())
+    view = _freeze(cDoc.unwrap())
+    _conf_cache[key] = (version, cDoc, view)
+    return cDoc, view
+
+
+def _file_version(path: str) -> Union[Tuple[int, int], None]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_conf(path: str) -> tk.TOMLDocument:
+    try:
+        with open(path, "r") as f:
+            return tk.parse(f.read())
+    except FileNotFoundError:
+        return tk.document()
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _load_conf(path: str) -> Tuple[tk.TOMLDocument, Mapping]:
+    """Parsed document and read-only view of a config file, reparsed only when
+    its mtime or size changed"""
+    version = _file_version(path)
+    cached = _conf_cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+    cDoc = _read_conf(path)
+    view = _freeze(cDoc.unwrap())
+    _conf_cache[path] = (version, cDoc, view)
+    return cDoc, view
+
+
+def _lookup(current_level: Any, keys: list, missing: Callable) -> Any:
+    # Navigate through keys, returning an empty table for non-existent keys
+    for key in keys or []:
+        if key in current_level:
+            current_level = current_level[key]
+        else:
+            return missing() if callable(missing) else missing
+    return current_level
+
+
 def conf_add(server_id: int, keys: list, name: str, value: Any, comment: str = None):
     """
     Add a new configuration entry to a server-specific TOML configuration file.
@@ -512,8 +690,61 @@ def conf_add(server_id: int, keys: list, name: str, value: Any, comment: str = N
         # [db.prod]
         # port = 5432
     """
-    cDoc = conf_get(server_id=server_id)
+    with conf_txn(server_id) as cDoc:
+        conf_set(cDoc, keys, name, value, comment)
+
+
+@contextmanager
+def conf_txn(server_id: int) -> Iterator[tk.TOMLDocument]:
+    """
+    Apply several edits to a server-specific configuration file in one write.
+
+    The file is locked for the duration of the block (against other
+    transactions and conf_add calls in this process), parsed into a private
+    document which the block edits, and written back once when the block exits
+    without an exception. The write is atomic, so a crash leaves either the
+    old or the new file. If the block raises nothing is written.
+
+    Args:
+        server_id (int): The ID of the server for which to modify configuration.
 
+    Yields:
+        tk.TOMLDocument: The document to edit, e.g. with conf_set.
+
+    Example:
+        >>> with conf_txn(12345) as cDoc:
+        ...     conf_set(cDoc, ['Minecraft', 'rcon'], 'host', 'localhost')
+        ...     conf_set(cDoc, ['Minecraft', 'rcon'], 'port', 25575)
+        # data/server-configs/12345.toml is written once
+    """
+    store = state_store()
+    path = _server_conf_path(server_id)
+    with _conf_lock(path):
+        # private copy to modify
+        if store is None:
+            cDoc = _read_conf(path)
+        else:
+            row = store.get_config(server_id)
+            cDoc = tk.parse(row[1]) if row else tk.document()
+        yield cDoc
+        if store is None:
+            atomic_write(path, tk.dumps(cDoc))
+        else:
+            store.put_config(server_id, tk.dumps(cDoc))
+    _notify_write(server_id)
+
+
+def conf_set(cDoc: tk.TOMLDocument, keys: list, name: str, value: Any, comment: str = None):
+    """
+    Set a key in a TOML document, creating intermediate tables as needed.
+
+    Args:
+        cDoc (tk.TOMLDocument): Document to edit, e.g. from conf_txn.
+        keys (list): Hierarchical keys of the section, e.g. ['Minecraft', 'rcon'].
+        name (str): The name of the configuration key to set.
+        value (Any): The value, must be a TOML-supported type.
+        comment (str, optional): Comment to add to the entry. Defaults to None.
+    """
     # Navigate to or create the nested structure
     current_level = cDoc
     for key in keys:
@@ -526,13 +757,6 @@ def conf_add(server_id: int, keys: list, name: str, value: Any, comment: str = N
     if comment is not None:
         current_level[name].comment(comment)
 
-    directory = "data/server-configs"
-    os.makedirs(directory, exist_ok=True)
-
-    file_path = os.path.join(directory, f"{server_id}.toml")
-    with open(file_path, "w") as f:
-        f.write(tk.dumps(cDoc))
-
 
 def conf_get(server_id: int, keys: list = None) -> Union[dict, Any]:
     """
@@ -575,27 +799,57 @@ def conf_get(server_id: int, keys: list = None) -> Union[dict, Any]:
     Note:
         - The function expects server configs in 'data/server-configs/{server_id}.toml'
         - Returns empty documents/tables for non-existent files or keys rather than raising errors
+        - The parsed document is cached until the file changes and shared between
+          callers, don't modify it, use conf_add
     """
-    if keys is None:
-        keys = []
+    cDoc, _ = _load_server_conf(server_id)
+    return _lookup(cDoc, keys, tk.table)
 
-    try:
-        with open(f"data/server-configs/{str(server_id)}.toml", "r") as f:
-            cDoc = tk.parse(f.read())
-    except FileNotFoundError:
-        cDoc = tk.document()
-        return cDoc
 
-    # Navigate through keys, creating empty tables for non-existent keys
-    current_level = cDoc
-    for key in keys:
-        if key in current_level:
-            current_level = current_level[key]
-        else:
-            # Key doesn't exist, return empty table
-            return tk.table()
+def conf_view(server_id: int, keys: list = None) -> Union[Mapping, Any]:
+    """
+    Read-only view of a server-specific configuration, for hot paths.
 
-    return current_level
+    Like conf_get, but tables are returned as read-only mappings of plain
+    Python values (str, int, bool, tuple, ...) instead of tomlkit containers.
+    The view is built once per version of the file, so a lookup is a stat and
+    a few dict accesses.
+
+    Args:
+        server_id (int): The ID of the server for which to read configuration.
+        keys (list, optional): Key path to the value, None for the whole file.
+
+    Returns:
+        Union[Mapping, Any]: The value at the key path, an empty mapping for
+            non-existent files or keys.
+
+    Example:
+        >>> rcon = conf_view(12345, ["Minecraft", "rcon"])
+        >>> rcon.get("port", 25575)
+        25575
+    """
+    _, view = _load_server_conf(server_id)
+    return _lookup(view, keys, _empty_view)
+
+
+def conf_version(server_id: int) -> Union[Tuple[int, int], int, None]:
+    """
+    Cheap change marker for a server-specific configuration file.
+
+    Returns the file's (mtime in ns, size) from a single os.stat, or the
+    row version when the state store is enabled, None if there is no config.
+    Callers that derive state from a server's config can keep the version
+    they built it from and rebuild only when it changes.
+
+    Example:
+        >>> version = conf_version(12345)
+        >>> if version != cached_version:
+        ...     rebuild(conf_get(12345))
+    """
+    store = state_store()
+    if store is not None:
+        return store.config_version(server_id)
+    return _file_version(_server_conf_path(server_id))
 
 
 def bot_conf_add(keys: list, name: str, value: Any, comment: str = None):
@@ -634,22 +888,25 @@ def bot_conf_add(keys: list, name: str, value: Any, comment: str = None):
         # [db.prod]
         # port = 5432
     """
-    cDoc = bot_conf_get()
+    with bot_conf_txn() as cDoc:
+        conf_set(cDoc, keys, name, value, comment)
 
-    # Navigate to or create the nested structure
-    current_level = cDoc
-    for key in keys:
-        if key not in current_level:
-            current_level[key] = tk.table()
-        current_level = current_level[key]
 
-    # Add the key-value pair
-    current_level[name] = value
-    if comment is not None:
-        current_level[name].comment(comment)
+@contextmanager
+def bot_conf_txn() -> Iterator[tk.TOMLDocument]:
+    """
+    Apply several edits to the main bot configuration in one atomic write,
+    see conf_txn.
 
-    with open("config.toml", "w") as f:
-        f.write(tk.dumps(cDoc))
+    Example:
+        >>> with bot_conf_txn() as cDoc:
+        ...     conf_set(cDoc, ['Discord'], 'Token', token, 'Required')
+    """
+    with _conf_lock("config.toml"):
+        cDoc = _read_conf("config.toml")  # private copy to modify
+        yield cDoc
+        atomic_write("config.toml", tk.dumps(cDoc))
+    _notify_write(None)
 
 
 def bot_conf_get(keys: list = None) -> Union[dict, Any]:
@@ -695,27 +952,23 @@ def bot_conf_get(keys: list = None) -> Union[dict, Any]:
     Note:
         - The function expects 'config.toml' in the current working directory
         - Returns empty documents/tables for non-existent files or keys rather than raising errors
+        - The parsed document is cached until the file changes and shared between
+          callers, don't modify it, use bot_conf_add
     """
-    if keys is None:
-        keys = []
+    cDoc, _ = _load_conf("config.toml")
+    return _lookup(cDoc, keys, tk.table)
 
-    try:
-        with open("config.toml", "r") as f:
-            cDoc = tk.parse(f.read())
-    except FileNotFoundError:
-        cDoc = tk.document()
-        return cDoc
 
-    # Navigate through keys, creating empty tables for non-existent keys
-    current_level = cDoc
-    for key in keys:
-        if key in current_level:
-            current_level = current_level[key]
-        else:
-            # Key doesn't exist, return empty table
-            return tk.table()
+def bot_conf_view(keys: list = None) -> Union[Mapping, Any]:
+    """
+    Read-only view of the main bot configuration, see conf_view.
 
-    return current_level
+    Example:
+        >>> bot_conf_view(["Minecraft"]).get("fetch_concurrency", 8)
+        8
+    """
+    _, view = _load_conf("config.toml")
+    return _lookup(view, keys, _empty_view)
 
 
 def get_all_cogs():
@@ -1,4 +1,6 @@
-from typing import Literal
+import asyncio, json, re, time
+from typing import Awaitable, Callable, List, Literal, Tuple
+from utils.exception import RconError
 
 
 def sendMessage(
@@ -13,3 +15,187 @@ def sendMessage(
         case "rcon":
             pass
     return True
+
+
+class PresenceTracker:
+    """
+    Online players of one server, kept up to date from join/leave log events.
+
+    The log is the primary source, an RCON `list` is only needed when the
+    tracker is stale: on startup, after the log rotated (server restart) and
+    every `reconcile_interval` seconds to correct any drift.
+
+    Example:
+        >>> presence = PresenceTracker()
+        >>> if presence.stale:
+        ...     presence.reconcile(await rcon_pool.command(guild.id, rcon, "list"))
+        >>> presence.apply(events)
+        >>> presence.format()
+        'There are 1 of a max of 20 players online: Steve'
+    """
+
+    LIST = re.compile(r"There are (\d+) (?:of a max of |/)(\d+) players online:(.*)")
+
+    def __init__(self, reconcile_interval: float = 300):
+        self.reconcile_interval = reconcile_interval
+        self.players = set()
+        self.max_players = None
+        self.synced_at = None  # time.monotonic() of the last reconcile
+        self.retry_at = 0  # time.monotonic() before which a failed reconcile isn't retried
+
+    @property
+    def stale(self) -> bool:
+        return (
+            self.synced_at is None
+            or time.monotonic() - self.synced_at > self.reconcile_interval
+        )
+
+    @property
+    def due(self) -> bool:
+        """Stale and not backing off from a failed reconcile"""
+        return self.stale and time.monotonic() >= self.retry_at
+
+    def failed(self, retry_in: float = 30):
+        """Record a failed reconcile, `due` stays False for `retry_in` seconds"""
+        self.retry_at = time.monotonic() + retry_in
+
+    @property
+    def online(self) -> bool:
+        return bool(self.players)
+
+    def apply(self, events):
+        """Update from parsed log events (utils.logs.LogEvent)"""
+        for event in events:
+            if event.kind == "join":
+                self.players.add(event.player)
+            elif event.kind == "leave":
+                self.players.discard(event.player)
+
+    def reconcile(self, list_output: str):
+        """
+        Replace the player set with the output of the RCON `list` command.
+
+        Output in another format (Essentials' `list`, an error message) counts
+        as a failed reconcile: it backs off like any other failure and raises
+        RconError, the player set is left as it was.
+        """
+        match = self.LIST.search(list_output)
+        if match is None:
+            self.failed()
+            raise RconError(f"Unrecognized list output: {list_output.strip()[:100]!r}")
+        self.max_players = int(match.group(2))
+        names = match.group(3).strip()
+        self.players = {name.strip() for name in names.split(",")} if names else set()
+        self.synced_at = time.monotonic()
+
+    def invalidate(self):
+        """Forget everything, the next check reconciles over RCON"""
+        self.players.clear()
+        self.synced_at = None
+
+    def format(self) -> str:
+        """Same wording as the vanilla `list` command"""
+        players = ", ".join(sorted(self.players, key=str.lower))
+        if self.max_players is None:  # never reconciled
+            return f"There are {len(self.players)} players online: {players}"
+        return f"There are {len(self.players)} of a max of {self.max_players} players online: {players}"
+
+
+# RCON rejects commands longer than this many bytes
+MAX_COMMAND_LENGTH = 1446
+
+
+def tellraw_commands(
+    lines: List[Tuple[str, str]],
+    target: str = "@a",
+    max_length: int = MAX_COMMAND_LENGTH,
+) -> List[str]:
+    """
+    Build `tellraw` commands showing Discord messages in Minecraft chat.
+
+    Every message becomes a JSON text component serialized with json.dumps,
+    so quotes, backslashes and newlines in the message can't break the
+    command. As many messages as fit in `max_length` are put in one command,
+    separated by newline components; a single message too long for a command
+    on its own is truncated.
+
+    Args:
+        lines (List[Tuple[str, str]]): (author, content) in order.
+        target (str, optional): Target selector. Defaults to "@a".
+        max_length (int, optional): Max command length in bytes.
+
+    Returns:
+        List[str]: The commands to run, usually just one.
+
+    Example:
+        >>> tellraw_commands([("Steve", 'say "hi"')])
+        ['tellraw @a ["", {"text": "[DISCORD] <Steve> say \\\\"hi\\\\""}]']
+    """
+    prefix = f"tellraw {target} "
+    budget = max_length - len(prefix) - len('["", ]')
+    newline = json.dumps({"text": "\n"})
+    commands, components, size = [], [], 0
+    for author, content in lines:
+        text = f"[DISCORD] <{author}> {content}"
+        component = json.dumps({"text": text})
+        while len(component) > budget:  # too long even on its own
+            text = text[: -max(1, (len(component) - budget) // 6)]
+            component = json.dumps({"text": f"{text}…"})
+
+        if components and size + len(newline) + len(component) + 4 > budget:
+            commands.append(prefix + '["", ' + ", ".join(components) + "]")
+            components, size = [], 0
+        if components:
+            components.append(newline)
+            size += len(newline) + 2
+        components.append(component)
+        size += len(component) + 2
+    if components:
+        commands.append(prefix + '["", ' + ", ".join(components) + "]")
+    return commands
+
+
+class TellrawQueue:
+    """
+    Discord → Minecraft chat pipeline batching messages per server.
+
+    A message for a server with nothing in flight is sent right away, while a
+    command is in flight further messages are queued and then sent together
+    as one tellraw. RCON traffic therefore grows with bursts, not with the
+    number of messages, without holding back a lone message.
+
+    Example:
+        >>> tellraw = TellrawQueue(self.runTellraw)
+        >>> tellraw.add(guild.id, message.author.name, message.content)
+        >>> await tellraw.close()  # on cog unload
+    """
+
+    def __init__(
+        self,
+        run: Callable[[int, str], Awaitable],
+        max_length: int = MAX_COMMAND_LENGTH,
+    ):
+        self.run = run  # run(guild_id, command)
+        self.max_length = max_length
+        self.pending = {}  # guild_id: [(author, content)]
+        self.workers = {}  # guild_id: asyncio.Task
+
+    def add(self, guild_id: int, author: str, content: str):
+        self.pending.setdefault(guild_id, []).append((author, content))
+        worker = self.workers.get(guild_id)
+        if worker is None or worker.done():
+            self.workers[guild_id] = asyncio.create_task(self._drain(guild_id))
+
+    async def _drain(self, guild_id: int):
+        while self.pending.get(guild_id):
+            lines = self.pending.pop(guild_id)
+            for command in tellraw_commands(lines, max_length=self.max_length):
+                try:
+                    await self.run(guild_id, command)
+                except Exception as e:
+                    print(f"Error sending message to Minecraft: {e}")
+
+    async def close(self):
+        """Wait for the queued messages to be sent"""
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        self.workers.clear()
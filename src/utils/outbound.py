@@ -0,0 +1,453 @@
+import aiohttp, asyncio, time
+from discord import Webhook
+from typing import Any, Awaitable, Callable, Hashable, List, Mapping, NamedTuple, Optional, Tuple
+from utils.config import guild_config
+from utils.exception import RateLimited
+
+
+class WebhookCache:
+    """
+    Owns the aiohttp session used for webhook delivery and caches the parsed
+    Webhook for each URL.
+
+    The session (and its connection pool) lives as long as the cog, so
+    consecutive webhook calls reuse a kept-alive TLS connection to
+    discord.com instead of opening and tearing down one per message.
+
+    Example:
+        >>> webhooks = WebhookCache()
+        >>> webhook = await webhooks.get(discord["webhook_url"])
+        >>> await webhook.send(content="hi", username="Steve")
+        >>> await webhooks.close()  # on cog unload
+    """
+
+    def __init__(self, keepalive_timeout: float = 60):
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+        self.webhooks = {}  # url: Webhook
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it on first use or after close"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(keepalive_timeout=self.keepalive_timeout)
+            )
+            self.webhooks.clear()  # bound to the old session
+        return self.session
+
+    async def get(self, url: str) -> Webhook:
+        """Return the Webhook for a URL, parsing it only once"""
+        session = await self.get_session()
+        webhook = self.webhooks.get(url)
+        if webhook is None:
+            webhook = Webhook.from_url(url, session=session)
+            self.webhooks[url] = webhook
+        return webhook
+
+    async def execute(
+        self, url: str, content: str, username: str = None, avatar_url: str = None
+    ) -> Mapping[str, str]:
+        """
+        Execute a webhook and return the response headers.
+
+        The request is made directly on the shared session (rather than
+        through Webhook.send, which sleeps on rate limits internally) so the
+        caller sees Discord's rate limit headers and decides how to wait.
+
+        Raises:
+            RateLimited: On a 429, with the delay Discord asked for.
+            aiohttp.ClientResponseError: On any other error status.
+        """
+        webhook = await self.get(url)
+        session = await self.get_session()
+        payload = {"content": content}
+        if username is not None:
+            payload["username"] = username
+        if avatar_url is not None:
+            payload["avatar_url"] = avatar_url
+        async with session.post(
+            f"https://discord.com/api/v10/webhooks/{webhook.id}/{webhook.token}",
+            json=payload,
+        ) as response:
+            if response.status == 429:
+                try:
+                    retry_after = (await response.json())["retry_after"]
+                except Exception:
+                    retry_after = float(response.headers.get("Retry-After", 1))
+                raise RateLimited(retry_after)
+            if response.status == 404:
+                self.forget(url)  # deleted, parse again if it comes back
+            response.raise_for_status()
+            return response.headers
+
+    def forget(self, url: str):
+        """Drop a cached webhook, e.g. after it was deleted"""
+        self.webhooks.pop(url, None)
+
+    async def close(self):
+        self.webhooks.clear()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+
+MESSAGE_LIMIT = 2000  # Discord's max message length
+
+
+def coalesce(
+    lines: List[Tuple[Optional[str], str]], limit: int = MESSAGE_LIMIT
+) -> List[Tuple[Optional[str], str]]:
+    """
+    Merge consecutive lines into as few messages as possible.
+
+    Consecutive lines with the same username are joined with newlines as long
+    as the result fits in `limit` characters, a change of username always
+    starts a new message. Lines that are longer than `limit` on their own are
+    split.
+
+    Args:
+        lines (List[Tuple[Optional[str], str]]): (username, text) in order.
+            Use the same username (e.g. None) for every line to merge
+            everything into multi-line blocks.
+        limit (int, optional): Max message length. Defaults to 2000.
+
+    Returns:
+        List[Tuple[Optional[str], str]]: (username, content) messages to send.
+
+    Example:
+        >>> coalesce([("Steve", "hi"), ("Steve", "o/"), ("Alex", "hey")])
+        [('Steve', 'hi\\no/'), ('Alex', 'hey')]
+    """
+    messages = []
+    for username, text in lines:
+        for start in range(0, max(len(text), 1), limit):
+            chunk = text[start : start + limit]
+            if messages and messages[-1][0] == username:
+                merged = f"{messages[-1][1]}\n{chunk}"
+                if len(merged) <= limit:
+                    messages[-1] = (username, merged)
+                    continue
+            messages.append((username, chunk))
+    return messages
+
+
+class Coalescer:
+    """
+    Buffers outgoing lines per destination and sends them coalesced.
+
+    The first line added to an empty buffer starts a timer of `hold` seconds,
+    when it fires everything buffered for that destination is merged with
+    coalesce() and handed to `send(destination, username, content)`. A line
+    therefore waits at most `hold` seconds; a buffer that already fills a
+    whole message is flushed straight away.
+
+    Example:
+        >>> coalescer = Coalescer(self.sendToDiscord, max_hold=0.5)
+        >>> coalescer.add(("webhook", url), "Steve", "hi")
+        >>> await coalescer.close()  # flushes what is left
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable],
+        max_hold: float = 0.5,
+        limit: int = MESSAGE_LIMIT,
+    ):
+        self.send = send
+        self.max_hold = max_hold
+        self.limit = limit
+        self.buffers = {}  # destination: [(username, text)]
+        self.sizes = {}  # destination: buffered characters
+        self.timers = {}  # destination: asyncio.Task
+
+    def add(
+        self,
+        destination: Hashable,
+        username: Optional[str],
+        text: str,
+        hold: Optional[float] = None,
+    ):
+        """Buffer a line, `hold` overrides max_hold for a new buffer"""
+        self.buffers.setdefault(destination, []).append((username, text))
+        self.sizes[destination] = self.sizes.get(destination, 0) + len(text) + 1
+        if self.sizes[destination] >= self.limit:
+            hold = 0  # a full message is ready
+            timer = self.timers.pop(destination, None)
+            if timer is not None:
+                timer.cancel()
+        elif destination in self.timers:
+            return
+        hold = self.max_hold if hold is None else hold
+        self.timers[destination] = asyncio.create_task(
+            self._flush_later(destination, hold)
+        )
+
+    async def _flush_later(self, destination: Hashable, hold: float):
+        await asyncio.sleep(hold)
+        self.timers.pop(destination, None)
+        await self.flush(destination)
+
+    async def flush(self, destination: Hashable):
+        """Send everything buffered for a destination now"""
+        lines = self.buffers.pop(destination, [])
+        self.sizes.pop(destination, None)
+        for username, content in coalesce(lines, self.limit):
+            try:
+                await self.send(destination, username, content)
+            except Exception as e:
+                print(f"Error sending message: {e}")
+
+    async def close(self):
+        """Cancel the timers and flush every buffer"""
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        for destination in list(self.buffers):
+            await self.flush(destination)
+
+
+class RateLimits:
+    """
+    Rate limit buckets learned from Discord's response headers.
+
+    Destinations are mapped to the bucket named in X-RateLimit-Bucket, so
+    destinations sharing a bucket wait for each other, and a bucket with no
+    requests remaining blocks until X-RateLimit-Reset-After has passed.
+    """
+
+    def __init__(self):
+        self.keys = {}  # destination: bucket key
+        self.blocked_until = {}  # bucket key: time.monotonic()
+
+    def delay(self, destination: Hashable) -> float:
+        """Seconds to wait before sending to a destination"""
+        key = self.keys.get(destination, destination)
+        return max(0.0, self.blocked_until.get(key, 0) - time.monotonic())
+
+    def update(self, destination: Hashable, headers: Optional[Mapping[str, str]]):
+        """Record the headers of a successful response"""
+        if not headers:
+            return
+        key = headers.get("X-RateLimit-Bucket", destination)
+        self.keys[destination] = key
+        if headers.get("X-RateLimit-Remaining") == "0":
+            reset_after = float(headers.get("X-RateLimit-Reset-After", 1))
+            self.blocked_until[key] = time.monotonic() + reset_after
+
+    def block(self, destination: Hashable, retry_after: float):
+        """Record a 429"""
+        key = self.keys.get(destination, destination)
+        self.blocked_until[key] = time.monotonic() + retry_after
+
+
+class Dispatcher:
+    """
+    Delivers messages through a separate queue and worker per destination.
+
+    `send(destination, username, content)` does the actual request and may
+    return the response headers, which feed the RateLimits buckets, and raise
+    RateLimited, in which case the same message is retried after the delay
+    Discord supplied. Server errors (5xx) and connection errors are retried
+    with exponential backoff up to `max_retries` times, anything else (a 4xx
+    such as a deleted webhook or missing permissions) won't succeed on a
+    retry and the message is dropped. A throttled destination only stalls
+    its own worker.
+
+    Queues are bounded: put() waits while a destination's queue is full, and
+    ingest can check full() to stop reading new lines until there is room,
+    so lines are held back instead of dropped. Queues live in memory only:
+    whatever close() can't deliver in time, or everything still queued if
+    close() is cancelled, is lost.
+
+    Logs name a destination by its kind and id, never by the webhook URL,
+    which contains the webhook's token.
+
+    Example:
+        >>> dispatcher = Dispatcher(self.sendToDiscord)
+        >>> await dispatcher.put(("webhook", url), "Steve", "hi")
+        >>> await dispatcher.close()  # on cog unload, best effort drain
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[Optional[Mapping[str, str]]]],
+        queue_size: int = 100,
+        max_retries: int = 5,
+    ):
+        self.send = send
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.rate_limits = RateLimits()
+        self.queues = {}  # destination: asyncio.Queue
+        self.workers = {}  # destination: asyncio.Task
+
+    def _queue(self, destination: Hashable) -> asyncio.Queue:
+        if destination not in self.queues:
+            self.queues[destination] = asyncio.Queue(self.queue_size)
+            self.workers[destination] = asyncio.create_task(self._work(destination))
+        return self.queues[destination]
+
+    def full(self, destination: Hashable) -> bool:
+        queue = self.queues.get(destination)
+        return queue is not None and queue.full()
+
+    async def put(self, destination: Hashable, username: Optional[str], content: str):
+        """Queue a message, waits while the destination's queue is full"""
+        await self._queue(destination).put((username, content))
+
+    async def _work(self, destination: Hashable):
+        queue = self.queues[destination]
+        while True:
+            username, content = await queue.get()
+            try:
+                await self._deliver(destination, username, content)
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, destination: Hashable, username: Optional[str], content: str):
+        failures = 0
+        while True:
+            delay = self.rate_limits.delay(destination)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                headers = await self.send(destination, username, content)
+            except RateLimited as e:
+                self.rate_limits.block(destination, e.retry_after)
+                continue  # doesn't count as a failure
+            except Exception as e:
+                if not self._retryable(e):
+                    print(
+                        f"Error sending message to {_redact(destination)}, dropping it: "
+                        f"{_redact_error(destination, e)}"
+                    )
+                    return
+                failures += 1
+                if failures > self.max_retries:
+                    print(
+                        f"Error sending message to {_redact(destination)}, giving up: "
+                        f"{_redact_error(destination, e)}"
+                    )
+                    return
+                await asyncio.sleep(min(2**failures, 60))
+                continue
+            self.rate_limits.update(destination, headers)
+            return
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        """Whether a failed send may succeed if repeated: 5xx or connection errors"""
+        status = getattr(error, "status", None)  # aiohttp and discord.py HTTP errors
+        if isinstance(status, int):
+            return status >= 500
+        return isinstance(error, (aiohttp.ClientConnectionError, OSError, asyncio.TimeoutError))
+
+    async def close(self, timeout: float = 10):
+        """Give the queues `timeout` seconds to drain, then stop the workers"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self.queues.values())),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            print("Discord delivery queues did not drain, dropping the rest")
+        for worker in self.workers.values():
+            worker.cancel()
+        self.queues.clear()
+        self.workers.clear()
+
+
+def _redact(destination: Hashable) -> str:
+    """Loggable name of a destination: "webhook <id>" or "channel <id>", no token"""
+    if isinstance(destination, tuple) and len(destination) == 2:
+        kind, target = destination
+        if kind == "webhook":
+            # https://discord.com/api/webhooks/<id>/<token>
+            parts = str(target).split("?")[0].rstrip("/").split("/")
+            return f"webhook {parts[-2] if len(parts) >= 2 else '?'}"
+        return f"{kind} {target}"
+    return type(destination).__name__
+
+
+def _redact_error(destination: Hashable, error: Exception) -> str:
+    """The error's text with the webhook URL, and so its token, cut out"""
+    text = str(error) or type(error).__name__
+    if isinstance(destination, tuple) and len(destination) == 2 and destination[0] == "webhook":
+        url = str(destination[1]).split("?")[0].rstrip("/")
+        text = text.replace(url, _redact(destination))
+        token = url.rsplit("/", 1)[-1]
+        if token:
+            text = text.replace(token, "<token>")
+    return text
+
+
+class Destination(NamedTuple):
+    """Where a guild's Minecraft chat goes, resolved from its ["Discord"] config"""
+
+    key: Tuple[str, Any]  # ("webhook", url) or ("channel", channel_id), the dispatcher queue
+    use_webhook: bool
+    hold: Optional[float]  # coalesce hold time, None for the default
+
+
+class DestinationRegistry:
+    """
+    Resolves each guild's delivery destination once and keeps it.
+
+    A guild's destination is rebuilt only when its config snapshot changed
+    (one os.stat per lookup instead of a TOML parse) or after invalidate(), and
+    channel objects are looked up once per channel id. Call invalidate() on
+    resync and invalidate_channel() when a channel is deleted.
+
+    Example:
+        >>> destinations = DestinationRegistry(bot)
+        >>> destination = destinations.get(guild.id)
+        >>> channel = destinations.channel(destination.key[1])
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.destinations = {}  # guild_id: (GuildConfig, Destination or None)
+        self.channels = {}  # channel_id: channel
+
+    def get(self, guild_id: int) -> Optional[Destination]:
+        """The guild's destination, None if Discord delivery isn't configured"""
+        conf = guild_config(guild_id)
+        cached = self.destinations.get(guild_id)
+        if cached is not None and cached[0] is conf:
+            return cached[1]
+
+        discord = conf.discord
+        if discord is None:
+            destination = None
+        elif discord.use_webhook:
+            destination = Destination(
+                ("webhook", discord.webhook_url), True, discord.coalesce_hold
+            )
+        else:
+            destination = Destination(
+                ("channel", discord.channel_id), False, discord.coalesce_hold
+            )
+        self.destinations[guild_id] = (conf, destination)
+        return destination
+
+    def channel(self, channel_id: int):
+        """The channel object for an id, looked up once"""
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.bot.get_channel(channel_id)
+            if channel is not None:
+                self.channels[channel_id] = channel
+        return channel
+
+    def invalidate(self, guild_id: int):
+        """Resolve the guild's destination again on the next lookup"""
+        entry = self.destinations.pop(guild_id, None)
+        if entry is not None and entry[1] is not None:
+            self.channels.pop(entry[1].key[1], None)
+
+    def invalidate_channel(self, channel_id: int):
+        """Forget a channel and every destination pointing at it"""
+        self.channels.pop(channel_id, None)
+        for guild_id, (_, destination) in list(self.destinations.items()):
+            if destination is not None and destination.key == ("channel", channel_id):
+                del self.destinations[guild_id]
@@ -0,0 +1,204 @@
+import asyncio, itertools, socket, struct
+from typing import Dict, List
+from utils.exception import RconError
+from utils.config import RconConfig
+
+# packet types, see https://minecraft.wiki/w/RCON
+LOGIN = 3
+COMMAND = 2
+RESPONSE = 0
+
+
+class RconClient:
+    """
+    Native asyncio RCON client keeping a single connection open.
+
+    One command is in flight at a time: the vanilla server reads each packet
+    with a single read of up to 1460 bytes and drops the connection if that
+    read holds more than one packet, so packets are never batched or
+    pipelined (and Nagle is disabled). A background reader task collects the
+    reply. Minecraft splits long replies over several packets without marking
+    the last one, so once the first fragment has arrived an empty sentinel
+    packet is sent, its echo marks the end of the command's reply.
+    """
+
+    def __init__(self, host: str, port: int, password: str, timeout: float = 10):
+        self.host = host
+        self.port = int(port)
+        self.password = password
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.ids = itertools.count(1)
+        self.lock = asyncio.Lock()  # one command in flight
+        self.pending: Dict[int, List[str]] = {}  # command id: reply fragments
+        self.first: Dict[int, asyncio.Future] = {}  # command id: first fragment arrived
+        self.sentinels: Dict[int, tuple] = {}  # sentinel id: (command id, future)
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        """Open the connection and authenticate"""
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            login_id = next(self.ids)
+            self.writer.write(self._packet(login_id, LOGIN, self.password))
+            await self.writer.drain()
+            while True:
+                request_id, packet_type, _ = await asyncio.wait_for(
+                    self._read_packet(), self.timeout
+                )
+                if request_id == -1:
+                    raise RconError("RCON authentication failed")
+                if request_id == login_id and packet_type == COMMAND:
+                    break
+        except BaseException:
+            self.writer.close()
+            self.writer = None
+            raise
+        self.reader_task = asyncio.create_task(self._read_loop())
+
+    async def command(self, command: str) -> str:
+        """Send a command and return the server's full reply"""
+        async with self.lock:
+            if not self.connected:
+                raise RconError("RCON client is not connected")
+            return await asyncio.wait_for(self._command(command), self.timeout)
+
+    async def _command(self, command: str) -> str:
+        loop = asyncio.get_running_loop()
+        command_id = next(self.ids)
+        sentinel_id = next(self.ids)
+        first = loop.create_future()
+        future = loop.create_future()
+        self.pending[command_id] = []
+        self.first[command_id] = first
+        self.sentinels[sentinel_id] = (command_id, future)
+        try:
+            self.writer.write(self._packet(command_id, COMMAND, command))
+            await self.writer.drain()
+            await first
+            # the server answers packets in order, so its echo follows the last fragment
+            self.writer.write(self._packet(sentinel_id, RESPONSE, ""))
+            await self.writer.drain()
+            return await future
+        finally:
+            for pending in (first, future):
+                if pending.done() and not pending.cancelled():
+                    pending.exception()  # retrieved, only one of them is awaited
+            self.pending.pop(command_id, None)
+            self.first.pop(command_id, None)
+            self.sentinels.pop(sentinel_id, None)
+
+    async def close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+            self.writer = None
+        self._fail_pending(RconError("RCON connection closed"))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                request_id, _, body = await self._read_packet()
+                if request_id in self.pending:
+                    self.pending[request_id].append(body)
+                    first = self.first.get(request_id)
+                    if first is not None and not first.done():
+                        first.set_result(None)
+                elif request_id in self.sentinels:
+                    command_id, future = self.sentinels[request_id]
+                    if not future.done():
+                        future.set_result("".join(self.pending.get(command_id, [])))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.writer.close()
+            self._fail_pending(RconError(f"RCON connection lost: {e}"))
+
+    def _fail_pending(self, error: Exception):
+        futures = [future for _, future in self.sentinels.values()]
+        for future in futures + list(self.first.values()):
+            if not future.done():
+                future.set_exception(error)
+
+    async def _read_packet(self) -> tuple:
+        (length,) = struct.unpack("<i", await self.reader.readexactly(4))
+        payload = await self.reader.readexactly(length)
+        request_id, packet_type = struct.unpack("<ii", payload[:8])
+        return request_id, packet_type, payload[8:-2].decode("utf-8", "replace")
+
+    @staticmethod
+    def _packet(request_id: int, packet_type: int, body: str) -> bytes:
+        payload = struct.pack("<ii", request_id, packet_type) + body.encode() + b"\x00\x00"
+        return struct.pack("<i", len(payload)) + payload
+
+
+class RconPool:
+    """
+    Keeps one RconClient per guild, reconnecting lazily when the connection
+    drops or the guild's ["Minecraft", "rcon"] config changes.
+
+    Example:
+        >>> pool = RconPool()
+        >>> await pool.command(guild.id, guild_config(guild.id).rcon, "list")
+        'There are 0 of a max of 20 players online: '
+    """
+
+    def __init__(self, timeout: float = 10):
+        self.timeout = timeout
+        self.clients = {}  # guild_id: (conf key, RconClient)
+        self.locks = {}  # guild_id: asyncio.Lock, guards connecting only
+
+    async def get(self, guild_id: int, rcon_conf: RconConfig) -> RconClient:
+        """Return a connected client for the guild"""
+        key = rcon_conf  # frozen, compares equal while the config is unchanged
+        lock = self.locks.setdefault(guild_id, asyncio.Lock())
+        async with lock:
+            entry = self.clients.get(guild_id)
+            if entry is not None:
+                conf_key, client = entry
+                if conf_key == key and client.connected:
+                    return client
+                del self.clients[guild_id]
+                await client.close()
+            client = RconClient(
+                key.host, key.port, key.password, timeout=self.timeout
+            )
+            await client.connect()
+            self.clients[guild_id] = (key, client)
+            return client
+
+    async def command(self, guild_id: int, rcon_conf: RconConfig, command: str) -> str:
+        """Run a command on the guild's server, retrying once on a dead connection"""
+        for attempt in range(2):
+            client = await self.get(guild_id, rcon_conf)
+            try:
+                return await client.command(command)
+            except (RconError, ConnectionError):
+                await self.drop(guild_id)
+                if attempt:
+                    raise
+
+    async def drop(self, guild_id: int):
+        entry = self.clients.pop(guild_id, None)
+        if entry is not None:
+            await entry[1].close()
+
+    async def close(self):
+        for guild_id in list(self.clients):
+            await self.drop(guild_id)
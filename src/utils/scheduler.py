@@ -0,0 +1,136 @@
+import asyncio, time
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+
+
+class AdaptiveInterval:
+    """
+    Poll interval that tracks activity.
+
+    Drops straight to `minimum` when the last poll found something and
+    multiplies by `factor` after each idle poll, up to `maximum`.
+    """
+
+    def __init__(self, minimum: float = 1, maximum: float = 30, factor: float = 2):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.current = minimum
+
+    def update(self, active: bool) -> float:
+        """Record the result of a poll and return the interval until the next one"""
+        if active:
+            self.current = self.minimum
+        else:
+            self.current = min(self.current * self.factor, self.maximum)
+        return self.current
+
+    def reset(self):
+        self.current = self.minimum
+
+
+class GuildScheduler:
+    """
+    Fans a per-guild coroutine out over every guild on each tick.
+
+    Jobs run concurrently, at most `concurrency` at a time, and each one is
+    cancelled once it has run for `deadline` seconds. A guild whose previous
+    job is still running (or waiting for a slot) is skipped for that tick
+    instead of queueing a second job, so a slow guild never delays the others
+    and work never stacks up.
+
+    Each guild is also polled on its own AdaptiveInterval: a job returns
+    whether it found anything new, active guilds are run on every tick that
+    reaches their minimum interval and idle ones back off up to their
+    maximum. `bounds(guild)` supplies the guild's (minimum, maximum) and is
+    read after every run, so config changes apply on the next poll. The
+    ticking loop should run at least as often as the smallest minimum.
+
+    Example:
+        >>> scheduler = GuildScheduler(self.fetchGuildLogs, concurrency=8, deadline=10)
+        >>> scheduler.tick(self.bot.guilds)  # from a tasks.loop
+        >>> scheduler.interval(guild.id)
+        8.0
+        >>> await scheduler.close()  # on cog unload
+    """
+
+    def __init__(
+        self,
+        job: Callable[..., Awaitable],
+        concurrency: int = 8,
+        deadline: float = 10,
+        name: str = "job",
+        bounds: Optional[Callable[..., Tuple[float, float]]] = None,
+    ):
+        self.job = job
+        self.deadline = deadline
+        self.name = name
+        self.bounds = bounds
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks = {}  # guild_id: asyncio.Task
+        self.intervals = {}  # guild_id: AdaptiveInterval
+        self.next_run = {}  # guild_id: time.monotonic() of the next poll
+
+    def configure(self, concurrency: Optional[int] = None, deadline: Optional[float] = None):
+        """Change the limits, jobs already running keep the ones they started with"""
+        if concurrency is not None:
+            self.semaphore = asyncio.Semaphore(concurrency)
+        if deadline is not None:
+            self.deadline = deadline
+
+    def busy(self, guild_id: int) -> bool:
+        task = self.tasks.get(guild_id)
+        return task is not None and not task.done()
+
+    def interval(self, guild_id: int) -> Optional[float]:
+        """Current poll interval of a guild, None if it hasn't been polled yet"""
+        interval = self.intervals.get(guild_id)
+        return None if interval is None else interval.current
+
+    def wake(self, guild_id: int):
+        """Poll a guild on the next tick and reset its interval to the minimum"""
+        self.next_run.pop(guild_id, None)
+        if guild_id in self.intervals:
+            self.intervals[guild_id].reset()
+
+    def tick(self, guilds: Iterable) -> int:
+        """Start a job for every guild that is due and not busy, returns how many started"""
+        now = time.monotonic()
+        started = 0
+        for guild in guilds:
+            if self.busy(guild.id) or self.next_run.get(guild.id, 0) > now:
+                continue
+            self.tasks[guild.id] = asyncio.create_task(self._run(guild))
+            started += 1
+        return started
+
+    async def _run(self, guild):
+        active = False
+        async with self.semaphore:
+            try:
+                active = await asyncio.wait_for(self.job(guild), self.deadline)
+            except asyncio.TimeoutError:
+                print(f"{self.name} for guild {guild.id} missed its {self.deadline}s deadline")
+            except Exception as e:
+                print(f"{self.name} for guild {guild.id} failed: {e}")
+        self._schedule(guild, bool(active))
+
+    def _schedule(self, guild, active: bool):
+        interval = self.intervals.setdefault(guild.id, AdaptiveInterval())
+        if self.bounds is not None:
+            try:
+                interval.minimum, interval.maximum = self.bounds(guild)
+            except Exception:
+                pass  # keep the previous bounds
+        self.next_run[guild.id] = time.monotonic() + interval.update(active)
+
+    def cancel(self) -> list:
+        """Cancel every running job without waiting, returns the cancelled tasks"""
+        tasks = [task for task in self.tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        return tasks
+
+    async def close(self):
+        """Cancel every running job and wait for them to finish"""
+        await asyncio.gather(*self.cancel(), return_exceptions=True)
+        self.tasks.clear()
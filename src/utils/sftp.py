@@ -0,0 +1,144 @@
+import paramiko, threading
+from typing import Tuple
+from utils.config import SftpConfig
+
+# most bytes one tail() call reads, a big backlog is worked off over several polls
+MAX_TAIL_BYTES = 4 * 1024 * 1024
+
+
+def tail(
+    sftp: paramiko.SFTPClient, path: str, offset: int, max_bytes: int = MAX_TAIL_BYTES
+) -> Tuple[bytes, int, bool]:
+    """
+    Read the complete lines appended to a remote file since a byte offset.
+
+    The remote file is stat'ed first and only the bytes past `offset` are
+    requested, so the amount transferred depends on how much was appended
+    rather than on the size of the file. At most `max_bytes` are read per
+    call, so a large backlog (first run, rotation, long outage) is returned
+    over several calls that each finish well within the fetch deadline. A
+    trailing partial line is left unread so the next call picks it up once
+    it is complete, unless a single line is longer than `max_bytes`, which
+    is then returned in pieces.
+
+    Args:
+        sftp (paramiko.SFTPClient): An open SFTP client.
+        path (str): Remote path of the file to tail, e.g. "logs/latest.log".
+        offset (int): Byte offset already consumed by the previous call.
+        max_bytes (int, optional): Most bytes to read. Defaults to MAX_TAIL_BYTES.
+
+    Returns:
+        Tuple[bytes, int, bool]: The new complete lines, the offset to store
+            for the next call, and whether the file shrank (rotated) since the
+            last call, in which case reading restarted from the beginning.
+
+    Example:
+        >>> data, offset, rotated = tail(sftp, "logs/latest.log", offset)
+        >>> for line in data.splitlines():
+        ...     print(line.decode("utf-8", errors="replace"))
+    """
+    size = sftp.stat(path).st_size
+    rotated = size < offset
+    if rotated:
+        offset = 0
+    if size == offset:
+        return b"", offset, rotated
+
+    length = min(size - offset, max_bytes)
+    with sftp.open(path, "rb") as f:
+        f.seek(offset)
+        f.prefetch(offset + length)
+        data = f.read(length)
+
+    end = data.rfind(b"\n")
+    if end == -1:
+        if len(data) == max_bytes:
+            return data, offset + len(data), rotated  # one huge line, don't stall on it
+        return b"", offset, rotated  # no complete line yet
+    data = data[: end + 1]
+    return data, offset + len(data), rotated
+
+
+class SFTPPool:
+    """
+    Keeps one authenticated SFTP session per guild open between log fetches.
+
+    Sessions are created lazily on first use, kept alive with SSH keepalive
+    packets and transparently re-established when the transport has died or
+    the guild's ["Minecraft", "sftp"] config has changed.
+
+    Example:
+        >>> pool = SFTPPool()
+        >>> sftp = pool.get(guild.id, guild_config(guild.id).sftp)
+        >>> data, offset, rotated = tail(sftp, "logs/latest.log", offset)
+        >>> pool.close()  # on cog unload
+    """
+
+    def __init__(self, keepalive: int = 30, timeout: float = 10):
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.sessions = {}  # guild_id: (conf key, SSHClient, SFTPClient)
+        self.locks = {}  # guild_id: threading.Lock, held while that guild connects
+        self.lock = threading.Lock()  # guards the two dicts only, never held across I/O
+
+    def get(self, guild_id: int, sftp_conf: SftpConfig) -> paramiko.SFTPClient:
+        """Return a live SFTP client for the guild, connecting if needed"""
+        key = sftp_conf  # frozen, compares equal while the config is unchanged
+        with self.lock:
+            guild_lock = self.locks.setdefault(guild_id, threading.Lock())
+        # a guild whose host is unreachable only blocks its own callers
+        with guild_lock:
+            with self.lock:
+                session = self.sessions.get(guild_id)
+            if session is not None:
+                conf_key, ssh, client = session
+                transport = ssh.get_transport()
+                if conf_key == key and transport is not None and transport.is_active():
+                    return client
+                with self.lock:
+                    if self.sessions.get(guild_id) is session:
+                        del self.sessions[guild_id]
+                self._close(session)
+
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                ssh.connect(
+                    key.host,
+                    port=key.port,
+                    username=key.username,
+                    password=key.password,
+                    timeout=self.timeout,
+                )
+                ssh.get_transport().set_keepalive(self.keepalive)
+                client = ssh.open_sftp()
+            except Exception:
+                ssh.close()
+                raise
+            with self.lock:
+                self.sessions[guild_id] = (key, ssh, client)
+            return client
+
+    def drop(self, guild_id: int):
+        """Close the guild's session, the next get() reconnects"""
+        with self.lock:
+            session = self.sessions.pop(guild_id, None)
+        if session is not None:
+            self._close(session)
+
+    def close(self):
+        """Close every session"""
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            self._close(session)
+
+    @staticmethod
+    def _close(session):
+        _, ssh, client = session
+        try:
+            client.close()
+        except Exception:
+            pass
+        ssh.close()
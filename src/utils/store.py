@@ -0,0 +1,209 @@
+import os, sqlite3, threading, time
+from typing import Dict, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guild_config (
+    guild_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL,
+    doc TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_state (
+    guild_id INTEGER PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    dedup BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class StateStore:
+    """
+    Embedded SQLite (WAL mode) store for per-guild config and log state.
+
+    Each guild is one row per table, keyed by its id, so a read or write
+    touches a single row instead of rewriting a whole file. Config writes
+    commit immediately (they are rare and must not be lost), log state writes
+    are buffered and committed together, at most every `commit_interval`
+    seconds and on flush(); the owner calls flush_due() regularly so the
+    buffer is committed within about `commit_interval` even when no further
+    writes arrive. Config versions are kept in memory, so checking
+    whether a guild's config changed needs no query.
+
+    The connection is shared between the event loop and executor threads and
+    guarded by a lock.
+
+    Example:
+        >>> store = StateStore("data/state.db")
+        >>> store.put_config(12345, '[Minecraft]\\nchat_enabled = true\\n')
+        >>> store.put_log_state(12345, offset, dedup.dumps())
+        >>> store.close()  # flushes buffered writes
+    """
+
+    def __init__(self, path: str = "data/state.db", commit_interval: float = 5):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.lock = threading.Lock()
+        self.pending = {}  # guild_id: (offset, dedup), buffered log state
+        self.last_commit = time.monotonic()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints, WAL stays consistent
+        self.db.executescript(SCHEMA)
+        self.versions = dict(
+            self.db.execute("SELECT guild_id, version FROM guild_config")
+        )  # guild_id: version
+
+    # ---- guild config ----
+
+    def config_version(self, guild_id: int) -> Optional[int]:
+        """Version of the guild's config, bumped by every put, None if there is none"""
+        return self.versions.get(guild_id)
+
+    def get_config(self, guild_id: int) -> Optional[Tuple[int, str]]:
+        """The guild's (version, TOML text), None if it has no config"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT version, doc FROM guild_config WHERE guild_id = ?", (guild_id,)
+            ).fetchone()
+
+    def put_config(self, guild_id: int, doc: str) -> int:
+        """Replace the guild's TOML text, returns the new version"""
+        with self.lock:
+            version = self.versions.get(guild_id, 0) + 1
+            self.db.execute(
+                "INSERT INTO guild_config (guild_id, version, doc, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (guild_id) DO UPDATE SET "
+                "version = excluded.version, doc = excluded.doc, updated = excluded.updated",
+                (guild_id, version, doc, time.time()),
+            )
+            self.versions[guild_id] = version
+            return version
+
+    # ---- log state ----
+
+    def get_log_state(self, guild_id: int) -> Optional[Tuple[int, bytes]]:
+        """The guild's (offset, dedup store dump), None if nothing was saved"""
+        with self.lock:
+            pending = self.pending.get(guild_id)
+            if pending is not None:
+                return pending
+            row = self.db.execute(
+                "SELECT offset, dedup FROM log_state WHERE guild_id = ?", (guild_id,)
+            ).fetchone()
+        return None if row is None else (row[0], bytes(row[1]))
+
+    def put_log_state(self, guild_id: int, offset: int, dedup: bytes):
+        """Buffer the guild's log state, committed with the next batch"""
+        with self.lock:
+            self.pending[guild_id] = (offset, dedup)
+            due = time.monotonic() - self.last_commit >= self.commit_interval
+        if due:
+            self.flush()
+
+    def flush_due(self):
+        """Commit the buffer if it has waited `commit_interval`, call this periodically
+        so the last writes before a quiet spell don't wait for the next put"""
+        with self.lock:
+            due = (
+                self.pending
+                and time.monotonic() - self.last_commit >= self.commit_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Commit every buffered log state in one transaction"""
+        with self.lock:
+            self.last_commit = time.monotonic()
+            if not self.pending:
+                return
+            now = time.time()
+            rows = [
+                (guild_id, offset, dedup, now)
+                for guild_id, (offset, dedup) in self.pending.items()
+            ]
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "INSERT INTO log_state (guild_id, offset, dedup, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (guild_id) DO UPDATE SET "
+                    "offset = excluded.offset, dedup = excluded.dedup, updated = excluded.updated",
+                    rows,
+                )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            self.pending.clear()
+
+    # ---- import ----
+
+    def import_files(self, config_dir: str = "data/server-configs", state_dir: str = "data/log_state") -> Dict[str, int]:
+        """
+        Copy the file-based per-guild config and log state into the store, once.
+
+        Guilds that already have a row are left alone and the files are not
+        touched, so the files stay a usable fallback. A meta row records the
+        import so later startups skip the directory scans.
+
+        Returns:
+            Dict[str, int]: How many configs and log states were imported.
+        """
+        imported = {"configs": 0, "log_states": 0}
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM meta WHERE key = 'files_imported'").fetchone():
+                return imported
+            now = time.time()
+            configs, states = [], []
+            for guild_id, path in _guild_files(config_dir, ".toml"):
+                if guild_id not in self.versions:
+                    with open(path, "r") as f:
+                        configs.append((guild_id, 1, f.read(), now))
+            known = {row[0] for row in self.db.execute("SELECT guild_id FROM log_state")}
+            for guild_id, path in _guild_files(state_dir, ".bin"):
+                if guild_id not in known:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    # MinecraftLogProcessor record: <4sQ header (b"MLP1", offset) + dedup dump
+                    if len(data) >= 12 and data[:4] == b"MLP1":
+                        states.append((guild_id, int.from_bytes(data[4:12], "little"), data[12:], now))
+
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "INSERT INTO guild_config (guild_id, version, doc, updated) VALUES (?, ?, ?, ?)",
+                    configs,
+                )
+                self.db.executemany(
+                    "INSERT INTO log_state (guild_id, offset, dedup, updated) VALUES (?, ?, ?, ?)",
+                    states,
+                )
+                self.db.execute("INSERT INTO meta (key, value) VALUES ('files_imported', ?)", (str(now),))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            for guild_id, version, _, _ in configs:
+                self.versions[guild_id] = version
+        imported["configs"], imported["log_states"] = len(configs), len(states)
+        return imported
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+
+def _guild_files(directory: str, suffix: str):
+    """(guild_id, path) of every <guild_id><suffix> file in a directory"""
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        name = entry.name
+        if name.endswith(suffix) and name[: -len(suffix)].isdigit():
+            yield int(name[: -len(suffix)]), entry.path
@@ -0,0 +1,495 @@
+import aiohttp, asyncio, hashlib, os, requests, time, uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import utils.executor as executor
+from utils.exception import DownloadError, UploadError
+
+CHUNK_SIZE = 1 << 16
+MANIFEST_URL = "https://launchermeta.mojang.com/mc/game/version_manifest.json"
+
+
+def download_jar(
+    url: str, sha1: str, path: str, size: int = None, timeout: float = 30
+) -> int:
+    """
+    Stream a file to disk, verifying its SHA-1 while it downloads.
+
+    The body is read in CHUNK_SIZE pieces and hashed as it is written to
+    `path`.part, so memory use doesn't depend on the size of the jar. The
+    part file is renamed to `path` only when the digest (and size, if given)
+    match, otherwise it is removed, so `path` never holds a partial or
+    corrupt jar. Blocking, run it with executor.run_blocking.
+
+    Args:
+        url (str): Download URL, e.g. the manifest's downloads.server.url.
+        sha1 (str): Expected hex SHA-1, downloads.server.sha1.
+        path (str): Where to put the verified file.
+        size (int, optional): Expected size in bytes, downloads.server.size.
+        timeout (float, optional): Socket timeout for connecting and each read.
+
+    Returns:
+        int: The number of bytes written.
+
+    Raises:
+        DownloadError: If the digest or size doesn't match.
+        requests.RequestException: If the download fails.
+
+    Example:
+        >>> server = manifest["downloads"]["server"]
+        >>> await executor.run_blocking(
+        ...     download_jar, server["url"], server["sha1"], f"data/updates/{guild.id}.jar",
+        ...     size=server["size"], timeout=600,
+        ... )
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    part = f"{path}.part"
+    digest = hashlib.sha1()
+    written = 0
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            with open(part, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    written += len(chunk)
+        if size is not None and written != size:
+            raise DownloadError(f"{url}: got {written} bytes, expected {size}")
+        if digest.hexdigest() != sha1.lower():
+            raise DownloadError(
+                f"{url}: sha1 {digest.hexdigest()} does not match {sha1}"
+            )
+        os.replace(part, path)
+    except BaseException:
+        try:
+            os.remove(part)
+        except FileNotFoundError:
+            pass
+        raise
+    return written
+
+
+async def upload_file(
+    get_url: Callable[[], Awaitable[str]],
+    path: str,
+    filename: str,
+    fields: dict = None,
+    progress: Callable[[int, int], None] = None,
+    attempts: int = 3,
+    stall_timeout: float = 60,
+) -> int:
+    """
+    Stream a file to a multipart/form-data upload URL.
+
+    The body is generated in CHUNK_SIZE pieces as aiohttp writes it, with a
+    Content-Length computed up front, so memory use doesn't depend on the
+    file size and reading waits whenever the socket is backed up. Each
+    attempt asks `get_url` for a fresh URL (signed URLs expire) and is
+    abandoned if no bytes move for `stall_timeout` seconds; failed attempts
+    are retried from the start with a growing delay.
+
+    Args:
+        get_url (Callable): Coroutine function returning the upload URL.
+        path (str): File to send.
+        filename (str): Name the file is uploaded as.
+        fields (dict, optional): Extra form fields, e.g. {"directory": "/"}.
+        progress (Callable, optional): Called with (bytes sent, total bytes).
+        attempts (int, optional): Attempts before giving up. Defaults to 3.
+        stall_timeout (float, optional): Seconds without progress that fail an attempt.
+
+    Returns:
+        int: The size of the file sent.
+
+    Raises:
+        UploadError: When the last attempt fails.
+
+    Example:
+        >>> await upload_file(
+        ...     lambda: panel.upload_url("/"), jar_path, "server.jar",
+        ...     fields={"directory": "/"}, progress=lambda sent, total: print(sent, total),
+        ... )
+    """
+    size = os.path.getsize(path)
+    boundary = uuid.uuid4().hex
+    head = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in (fields or {}).items()
+    ) + (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + size + len(tail)),
+    }
+
+    last_error = None
+    # no total limit, a slow but moving upload is fine, the stall check ends dead ones
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(2**attempt)
+            sent = 0
+            last_progress = time.monotonic()
+
+            async def body():
+                nonlocal sent, last_progress
+                yield head
+                with open(path, "rb") as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        yield chunk  # resumes once aiohttp has written the previous one
+                        sent += len(chunk)
+                        last_progress = time.monotonic()
+                        if progress is not None:
+                            progress(sent, size)
+                yield tail
+
+            async def send():
+                url = await get_url()
+                async with session.post(url, data=body(), headers=headers) as response:
+                    if response.status >= 400:
+                        raise UploadError(f"HTTP {response.status}: {(await response.text())[:200]}")
+
+            task = asyncio.create_task(send())
+            try:
+                while True:
+                    done, _ = await asyncio.wait({task}, timeout=stall_timeout / 4)
+                    if done:
+                        task.result()
+                        return size
+                    if time.monotonic() - last_progress >= stall_timeout:
+                        raise UploadError(f"stalled at {sent}/{size} bytes")
+            except (
+                aiohttp.ClientError,
+                requests.RequestException,  # from get_url, e.g. PanelClient.upload_url
+                asyncio.TimeoutError,
+                UploadError,
+            ) as e:
+                last_error = e
+                print(f"Upload of {filename} failed (attempt {attempt + 1}/{attempts}): {e}")
+            finally:
+                if not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+    raise UploadError(f"{filename} upload failed after {attempts} attempts: {last_error}")
+
+
+class ManifestCache:
+    """
+    Mojang's version manifest, shared by every guild.
+
+    The manifest is fetched at most once per `max_age` seconds and then
+    revalidated with If-None-Match / If-Modified-Since, so an unchanged
+    manifest costs a 304. Concurrent callers wait for the same request. The
+    per-version JSON is cached by id and refetched only when the manifest
+    points the id at a different URL.
+
+    Example:
+        >>> manifests = ManifestCache()
+        >>> version_id = await manifests.latest("release")
+        >>> server = (await manifests.version(version_id))["downloads"]["server"]
+    """
+
+    def __init__(self, url: str = MANIFEST_URL, max_age: float = 60):
+        self.url = url
+        self.max_age = max_age
+        self.manifest = None
+        self.entries = {}  # version id: manifest entry
+        self.versions = {}  # version id: (url, version JSON)
+        self.etag = None
+        self.last_modified = None
+        self.fetched = None  # time.monotonic() of the last (re)validation
+        self.lock = asyncio.Lock()
+
+    async def get(self) -> dict:
+        """The version manifest, revalidated if older than max_age"""
+        async with self.lock:
+            if (
+                self.manifest is not None
+                and time.monotonic() - self.fetched < self.max_age
+            ):
+                return self.manifest
+            headers = {}
+            if self.manifest is not None:
+                if self.etag:
+                    headers["If-None-Match"] = self.etag
+                if self.last_modified:
+                    headers["If-Modified-Since"] = self.last_modified
+            response = await executor.request("GET", self.url, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+                self.manifest = response.json()
+                self.entries = {v["id"]: v for v in self.manifest["versions"]}
+                self.etag = response.headers.get("ETag")
+                self.last_modified = response.headers.get("Last-Modified")
+            self.fetched = time.monotonic()
+            return self.manifest
+
+    async def latest(self, channel: str = "snapshot") -> str:
+        """Id of the newest version on a channel, "release" or "snapshot"
+
+        Mojang's latest snapshot is the newest version of any type, so
+        "snapshot" also follows releases."""
+        manifest = await self.get()
+        return manifest["latest"][channel]
+
+    async def version(self, version_id: str) -> dict:
+        """The per-version JSON (downloads, java version, ...) of a version id"""
+        await self.get()
+        entry = self.entries[version_id]
+        cached = self.versions.get(version_id)
+        if cached is not None and cached[0] == entry["url"]:
+            return cached[1]
+        response = await executor.request("GET", entry["url"])
+        response.raise_for_status()
+        version = response.json()
+        self.versions[version_id] = (entry["url"], version)
+        return version
+
+
+class JarCache:
+    """
+    Content-addressed store of downloaded jars, keyed by SHA-1.
+
+    A jar is downloaded (and verified) once and every guild updating to that
+    version uploads from the same file. Concurrent requests for a digest
+    share one download. Jars in use are pinned; the others are evicted
+    least recently used first once the cache grows past `max_bytes`.
+
+    Example:
+        >>> jars = JarCache()
+        >>> server = version["downloads"]["server"]
+        >>> async with jars.open(server["url"], server["sha1"], server["size"]) as path:
+        ...     await upload(path)
+    """
+
+    def __init__(self, directory: str = "data/jar-cache", max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.downloads = {}  # sha1: asyncio.Task, in flight
+        self.pins = Counter()  # sha1: users
+
+    def path(self, sha1: str) -> str:
+        return os.path.join(self.directory, f"{sha1.lower()}.jar")
+
+    @asynccontextmanager
+    async def open(self, url: str, sha1: str, size: int = None) -> AsyncIterator[str]:
+        """Path of the verified jar, downloaded if needed and pinned while in use"""
+        sha1 = sha1.lower()
+        self.pins[sha1] += 1
+        try:
+            yield await self.get(url, sha1, size)
+        finally:
+            self.pins[sha1] -= 1
+            if self.pins[sha1] <= 0:
+                del self.pins[sha1]
+
+    async def get(self, url: str, sha1: str, size: int = None) -> str:
+        """Path of the verified jar, downloading it if needed (not pinned, see open)"""
+        sha1 = sha1.lower()
+        path = self.path(sha1)
+        if os.path.exists(path):
+            os.utime(path)  # most recently used
+            return path
+        task = self.downloads.get(sha1)
+        if task is None:
+            task = asyncio.create_task(self._download(url, sha1, size))
+            self.downloads[sha1] = task
+            task.add_done_callback(lambda _: self.downloads.pop(sha1, None))
+        # one caller giving up mustn't cancel the download for the others
+        return await asyncio.shield(task)
+
+    async def _download(self, url: str, sha1: str, size: Optional[int]) -> str:
+        path = self.path(sha1)
+        await executor.run_blocking(download_jar, url, sha1, path, size=size, timeout=600)
+        await executor.run_blocking(self.evict)
+        return path
+
+    def evict(self) -> int:
+        """Remove unpinned jars, oldest use first, until the cache fits, returns bytes freed"""
+        try:
+            entries = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry)
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".jar")
+            ]
+        except FileNotFoundError:
+            return 0
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total - freed <= self.max_bytes:
+                break
+            if entry.name[: -len(".jar")] in self.pins:
+                continue
+            try:
+                os.remove(entry.path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+
+class PanelClient:
+    """
+    The Pterodactyl client API calls the updater makes for one server.
+
+    Example:
+        >>> panel = PanelClient(guild_config(guild.id).panel)
+        >>> await panel.power("stop")
+        >>> await panel.wait_for_state("offline")
+    """
+
+    def __init__(self, panel, timeout: float = 30):
+        self.base = panel.url.rstrip("/")
+        self.server_url = f"{self.base}/api/client/servers/{panel.server_id}"
+        self.timeout = timeout
+        self.headers = {
+            "Authorization": f"Bearer {panel.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "Application/vnd.pterodactyl.v1+json",
+        }
+
+    async def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        response = await executor.request(
+            method, url, headers=self.headers, timeout=self.timeout, **kwargs
+        )
+        response.raise_for_status()
+        return response
+
+    async def is_minecraft(self) -> bool:
+        response = await self._request("GET", self.server_url)
+        return response.json()["attributes"].get("is_minecraft", True)
+
+    async def power(self, signal: str):
+        """Send "start", "stop", "restart" or "kill" """
+        await self._request("POST", f"{self.server_url}/power", json={"signal": signal})
+
+    async def state(self) -> str:
+        """Current power state: "offline", "starting", "running" or "stopping" """
+        response = await self._request("GET", f"{self.server_url}/resources")
+        return response.json()["attributes"]["current_state"]
+
+    async def wait_for_state(self, state: str, timeout: float = 120, interval: float = 2):
+        """Poll the power state until it is `state`, raises asyncio.TimeoutError"""
+        deadline = time.monotonic() + timeout
+        while await self.state() != state:
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError(f"server not {state} after {timeout}s")
+            await asyncio.sleep(interval)
+
+    async def upload_url(self, directory: str = "/") -> str:
+        """A signed URL to upload files into `directory`"""
+        response = await self._request(
+            "GET", f"{self.server_url}/files/upload", params={"directory": directory}
+        )
+        return response.json()["attributes"]["url"]
+
+
+STAGES = ("check", "download", "stop", "upload", "start", "verify")
+
+
+class UpdateProgress:
+    """Where one guild's update is, shown by /update"""
+
+    def __init__(self):
+        self.status = "queued"  # queued, running, updated, up to date, failed
+        self.stage = None  # one of STAGES while running
+        self.version = None  # version being installed, once known
+        self.error = None
+        self.sent = 0  # upload bytes sent / total
+        self.total = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def enter(self, stage: str):
+        self.stage = stage
+
+    def transferred(self, sent: int, total: int):
+        """Upload progress callback"""
+        self.sent, self.total = sent, total
+
+    def format(self) -> str:
+        target = f" to {self.version}" if self.version else ""
+        if self.status == "queued":
+            return "Update queued"
+        if self.status == "running":
+            step = STAGES.index(self.stage) + 1 if self.stage in STAGES else 0
+            text = f"Updating{target}: {self.stage} ({step}/{len(STAGES)})"
+            if self.stage == "upload" and self.total:
+                text += f", {self.sent / 2**20:.1f}/{self.total / 2**20:.1f} MiB"
+            return text
+        elapsed = f"{self.finished - self.started:.0f}s"
+        if self.status == "failed":
+            return f"Update{target} failed during {self.stage} after {elapsed}: {self.error}"
+        if self.status == "updated":
+            return f"Updated{target} in {elapsed}"
+        return "Already up to date"
+
+
+class UpdatePipeline:
+    """
+    Runs per-guild updates concurrently, at most `concurrency` at a time.
+
+    `job(guild, progress)` performs the stages, calling progress.enter()
+    as it goes, and returns whether it installed anything. A guild is never
+    updated twice at once, and one guild failing doesn't affect the others,
+    so a run takes about as long as its slowest guild.
+
+    Example:
+        >>> pipeline = UpdatePipeline(self.updateGuild, concurrency=4)
+        >>> await pipeline.run(guilds)  # from the hourly loop
+        >>> pipeline.start(ctx.guild).format()  # from /update
+        'Update queued'
+    """
+
+    def __init__(self, job, concurrency: int = 4):
+        self.job = job
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.progress = {}  # guild_id: UpdateProgress of the latest update
+        self.tasks = {}  # guild_id: asyncio.Task
+
+    def busy(self, guild_id: int) -> bool:
+        task = self.tasks.get(guild_id)
+        return task is not None and not task.done()
+
+    def start(self, guild) -> UpdateProgress:
+        """Start updating a guild unless it already is, returns its progress"""
+        if self.busy(guild.id):
+            return self.progress[guild.id]
+        progress = self.progress[guild.id] = UpdateProgress()
+        self.tasks[guild.id] = asyncio.create_task(self._run(guild, progress))
+        return progress
+
+    async def run(self, guilds):
+        """Update every guild and wait for all of them"""
+        for guild in guilds:
+            self.start(guild)
+        tasks = [self.tasks[guild.id] for guild in guilds]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, guild, progress: UpdateProgress):
+        async with self.semaphore:
+            progress.status = "running"
+            try:
+                updated = await self.job(guild, progress)
+                progress.status = "updated" if updated else "up to date"
+            except Exception as e:
+                progress.status = "failed"
+                progress.error = str(e) or type(e).__name__
+                print(f"Update for guild {guild.id} failed during {progress.stage}: {progress.error}")
+            finally:
+                progress.finished = time.monotonic()
+
+    async def close(self):
+        tasks = [task for task in self.tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)